@@ -0,0 +1,103 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from coalescing_cache import CoalescingCache
+
+
+def normalize_question(text):
+    """Case-, whitespace- and punctuation-insensitive form of a question"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AnswerCache(CoalescingCache):
+    """LRU+TTL cache of chatbot answers, persisted to a JSON file, with request coalescing
+
+    Concurrent lookups for the same key share one upstream call: the first caller
+    computes the answer and the others wait for its result.
+    """
+
+    def __init__(self, path=None, max_entries=5000, ttl=7 * 24 * 3600, save_every=50):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        self.save_every = save_every
+        self._dirty = 0
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def key(question, model, system_prompt, language=None):
+        parts = [normalize_question(question), model, system_prompt, language or ""]
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def put(self, key, answer, ttl=None):
+        """Cache a non-empty answer; an empty one (e.g. a stream that produced nothing) is not kept"""
+        if not answer:
+            return
+        super().put(key, answer, ttl)
+        with self._lock:
+            self._dirty += 1
+            save = self.path and self._dirty >= self.save_every
+        if save:
+            self.save()
+
+    def stream(self, key, produce):
+        """Yield the answer for `key` in pieces, from `produce()` (an iterable of text) on a miss
+
+        Concurrent streams for the same key share one `produce()` call: the first
+        caller streams it and the others get the whole answer once it is complete.
+        """
+        answer, future, owner = self.claim(key)
+        if future is None:
+            yield answer
+            return
+        if not owner:
+            yield future.result()
+            return
+        parts = []
+        try:
+            for part in produce():
+                parts.append(part)
+                yield part
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        except GeneratorExit:
+            # The leading client went away before the answer was complete
+            self.finish(key, future, error=RuntimeError("Answer stream was abandoned"))
+            raise
+        self.finish(key, future, "".join(parts).strip())
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for key, expires, answer in data:
+                if expires > now and answer:
+                    self._entries[key] = (expires, answer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        with self._lock:
+            data = [[key, expires, answer] for key, (expires, answer) in self._entries.items()]
+            self._dirty = 0
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving answer cache: {e}")
@@ -1,113 +1,153 @@
+from lazy_imports import LazyModule, mark_booted, print_startup_report, startup_report
 import os
+import json
+import math
 import sqlite3
 import random
-import string
 import re
-import torch
-import torch.nn.functional as F
-import timm
-import cv2
-import numpy as np
 import io
-import base64
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+import time
+from datetime import datetime, timezone
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Flask, Response, g, render_template, send_file, stream_with_context, request, redirect, url_for, session, flash, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from gtts import gTTS
-from groq import Groq
-import markdown
-from torchvision import transforms
-from PIL import Image
+import db
+from batching import BatcherClosed
+from model_registry import ModelRegistry, CropSpec
+from heatmaps import HeatmapStore
+from overlay_store import MIMETYPES, OverlayStore, encode_overlay, make_overlay
+from answer_cache import AnswerCache
+from write_behind import PredictionWriter
+from result_cache import ResultCache
+from preprocess import ImageRejected, decode_leaf_image, to_model_input
+from tts import AudioStore, SpeechJobs
+from audio_input import AudioRejected, prepare_for_transcription
+from metrics import Metrics
+import survey
+import irrigation as irrigation_planner
+from weather import OpenWeatherMapProvider, StubProvider, WeatherCache, WeatherRejected, current_conditions
+
+# Heavy dependencies are imported on first use so pages that don't need them boot fast
+gtts = LazyModule("gtts")
+groq = LazyModule("groq")
+markdown = LazyModule("markdown")
 
 # ----------------- APP CONFIG -----------------
 app = Flask(__name__)
 app.secret_key = "supersecretkey"  # Change in production
-app.config['UPLOAD_FOLDER'] = 'Uploads'
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs('static/audio', exist_ok=True)
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a'}
 
-# Initialize Groq client
-groq_client = Groq(api_key="")
+# Groq client is created on the first chatbot request
+_groq_client = None
+
+def get_groq_client():
+    global _groq_client
+    if _groq_client is None:
+        _groq_client = groq.Groq(api_key=os.environ.get("GROQ_API_KEY", ""))
+    return _groq_client
+
+# ----------------- METRICS -----------------
+metrics = Metrics()
+metrics.describe("agroai_http_requests_total", "counter", "HTTP requests by route, method and status")
+metrics.describe("agroai_http_request_duration_seconds", "histogram",
+                 "Time to produce the response (for streamed responses, until the body starts)")
+metrics.describe("agroai_detect_stage_seconds", "histogram", "Disease detection time per pipeline stage")
+metrics.describe("agroai_upstream_seconds", "histogram", "Latency of calls to external services")
+metrics.describe("agroai_upstream_errors_total", "counter", "Failed calls to external services")
+# Set by serve.py: each worker dumps its metrics here so any worker's /metrics covers all of them
+METRICS_DIR = os.environ.get("AGROAI_METRICS_DIR")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("agroai_http_request_duration_seconds", time.perf_counter() - started,
+                        route=route, method=request.method)
+        metrics.inc("agroai_http_requests_total", route=route, method=request.method, status=response.status_code)
+    return response
 
 # ----------------- MODEL SETUP -----------------
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+DEVICE = os.environ.get("AGROAI_DEVICE")  # None picks cuda when available, else cpu
 POTATO_MODEL_PATH = "best_model_potato_updated.pth"
 TOMATO_MODEL_PATH = "best_tomato_model.pth"  # Assuming this is the path to the tomato model
 
-potato_model = None
-tomato_model = None
-
-try:
-    potato_model = timm.create_model("tf_efficientnet_b0", pretrained=False, num_classes=7)
-    state_dict = torch.load(POTATO_MODEL_PATH, map_location=DEVICE)
-    potato_model.load_state_dict(state_dict)
-    potato_model = potato_model.to(DEVICE)
-    potato_model.eval()
-    print("Potato disease detection model loaded successfully!")
-except Exception as e:
-    print(f"Warning: Could not load potato disease detection model: {e}")
-    print("Potato disease detection features will be disabled.")
-
-try:
-    tomato_model = timm.create_model("tf_efficientnet_b0", pretrained=False, num_classes=10)
-    state_dict = torch.load(TOMATO_MODEL_PATH, map_location=DEVICE)
-    tomato_model.load_state_dict(state_dict)
-    tomato_model = tomato_model.to(DEVICE)
-    tomato_model.eval()
-    print("Tomato disease detection model loaded successfully!")
-except Exception as e:
-    print(f"Warning: Could not load tomato disease detection model: {e}")
-    print("Tomato disease detection features will be disabled.")
-
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
-
-potato_class_names = [
-    "Early Blight",
-    "Fungal Diseases", 
-    "Healthy",
-    "Late Blight",
-    "Plant Pests",
-    "Potato Cyst Nematode",
-    "Potato Virus"
-]
-
-tomato_class_names = [
-    'Tomato_Bacterial_spot', 
-    'Tomato_Early_blight', 
-    'Tomato_Late_blight', 
-    'Tomato_Leaf_Mold', 
-    'Tomato_Septoria_leaf_spot', 
-    'Tomato_Spider_mites Two-spotted_spider_mite', 
-    'Tomato_Target_Spot', 
-    'Tomato_Tomato_Yellow_Leaf_Curl_Virus', 
-    'Tomato_Tomato_mosaic_virus', 
-    'Tomato_healthy'
-]
-
-CLASS_COLORMAPS = {
-    "Early Blight": cv2.COLORMAP_JET,
-    "Fungal Diseases": cv2.COLORMAP_OCEAN,
-    "Healthy": None,
-    "Late Blight": cv2.COLORMAP_TURBO,
-    "Plant Pests": cv2.COLORMAP_HOT,
-    "Potato Cyst Nematode": cv2.COLORMAP_SPRING,
-    "Potato Virus": cv2.COLORMAP_WINTER,
-    'Tomato_Bacterial_spot': cv2.COLORMAP_BONE,
-    'Tomato_Early_blight': cv2.COLORMAP_OCEAN,
-    'Tomato_Late_blight': cv2.COLORMAP_WINTER,
-    'Tomato_Leaf_Mold': cv2.COLORMAP_HOT,
-    'Tomato_Septoria_leaf_spot': cv2.COLORMAP_TWILIGHT,
-    'Tomato_Spider_mites Two-spotted_spider_mite': cv2.COLORMAP_INFERNO,
-    'Tomato_Target_Spot': cv2.COLORMAP_PLASMA,
-    'Tomato_Tomato_Yellow_Leaf_Curl_Virus': cv2.COLORMAP_VIRIDIS,
-    'Tomato_Tomato_mosaic_virus': cv2.COLORMAP_MAGMA,
-    'Tomato_healthy': None,
-}
+# Concurrent /detect requests for the same crop are grouped into one forward pass
+BATCH_MAX_SIZE = int(os.environ.get("AGROAI_BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get("AGROAI_BATCH_MAX_WAIT_MS", 10))
+
+# Models are loaded on first use and reloaded when their checkpoint file changes
+model_registry = ModelRegistry(
+    DEVICE,
+    batch_max_size=BATCH_MAX_SIZE,
+    batch_max_wait_ms=BATCH_MAX_WAIT_MS,
+    warmup_runs=int(os.environ.get("AGROAI_WARMUP_RUNS", 1)),
+    # torch | onnx | onnx-int8; ONNX graphs are exported next to the checkpoint on first load
+    backend=os.environ.get("AGROAI_INFERENCE_BACKEND", "torch"),
+    # 0 turns off the checkpoint mtime check (serve.py reloads on SIGHUP instead)
+    reload_check_interval=float(os.environ.get("AGROAI_RELOAD_CHECK_SECONDS", 30)),
+)
+
+model_registry.register(CropSpec(
+    "Potato",
+    POTATO_MODEL_PATH,
+    class_names=[
+        "Early Blight",
+        "Fungal Diseases",
+        "Healthy",
+        "Late Blight",
+        "Plant Pests",
+        "Potato Cyst Nematode",
+        "Potato Virus"
+    ],
+    colormaps={
+        "Early Blight": "JET",
+        "Fungal Diseases": "OCEAN",
+        "Healthy": None,
+        "Late Blight": "TURBO",
+        "Plant Pests": "HOT",
+        "Potato Cyst Nematode": "SPRING",
+        "Potato Virus": "WINTER",
+    },
+))
+
+model_registry.register(CropSpec(
+    "Tomato",
+    TOMATO_MODEL_PATH,
+    class_names=[
+        'Tomato_Bacterial_spot',
+        'Tomato_Early_blight',
+        'Tomato_Late_blight',
+        'Tomato_Leaf_Mold',
+        'Tomato_Septoria_leaf_spot',
+        'Tomato_Spider_mites Two-spotted_spider_mite',
+        'Tomato_Target_Spot',
+        'Tomato_Tomato_Yellow_Leaf_Curl_Virus',
+        'Tomato_Tomato_mosaic_virus',
+        'Tomato_healthy'
+    ],
+    colormaps={
+        'Tomato_Bacterial_spot': "BONE",
+        'Tomato_Early_blight': "OCEAN",
+        'Tomato_Late_blight': "WINTER",
+        'Tomato_Leaf_Mold': "HOT",
+        'Tomato_Septoria_leaf_spot': "TWILIGHT",
+        'Tomato_Spider_mites Two-spotted_spider_mite': "INFERNO",
+        'Tomato_Target_Spot': "PLASMA",
+        'Tomato_Tomato_Yellow_Leaf_Curl_Virus': "VIRIDIS",
+        'Tomato_Tomato_mosaic_virus': "MAGMA",
+        'Tomato_healthy': None,
+    },
+))
+
+# Crops listed here are loaded and warmed up in the background at startup, e.g. "Potato,Tomato"
+PRELOAD_CROPS = [c for c in os.environ.get("AGROAI_PRELOAD_CROPS", "").split(",") if c]
+model_registry.preload(PRELOAD_CROPS)
 
 # ----------------- DISEASE INFORMATION DATABASE -----------------
 DISEASE_INFO = {
@@ -642,77 +682,135 @@ def get_disease_info(disease_name):
         'pesticide': random.choice(disease_data['pesticides'])
     }
 # ----------------- DB SETUP -----------------
+# One pooled connection is checked out per request and returned on teardown
+DB_PATH = os.environ.get("AGROAI_DB", "agroai.db")
+db_pool = db.ConnectionPool(DB_PATH)
+
+def get_db():
+    if "db" not in g:
+        g.db = db_pool.checkout()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        db_pool.checkin(conn)
+
 def init_db():
-    with sqlite3.connect("agroai.db") as conn:
-        c = conn.cursor()
-        # Users table
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
-            )
-        """)
-        # Irrigation plans table
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS irrigation_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                crop_type TEXT,
-                field_size REAL,
-                soil_type TEXT,
-                growth_stage TEXT,
-                temperature REAL,
-                humidity REAL,
-                liters_per_day REAL,
-                times_per_week INTEGER,
-                minutes_per_session INTEGER,
-                best_time TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Predictions table
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS predictions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                crop_type TEXT,
-                predicted_class TEXT,
-                confidence REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+    conn = db_pool.checkout()
+    try:
+        db.init_db(conn)
+    finally:
+        db_pool.checkin(conn)
 
 init_db()
 
+# Optional write-behind logging takes prediction inserts off the /detect request path
+prediction_writer = None
+if os.environ.get("AGROAI_WRITE_BEHIND") == "1":
+    prediction_writer = PredictionWriter(
+        db_pool,
+        batch_size=int(os.environ.get("AGROAI_WRITE_BEHIND_BATCH", 200)),
+        flush_interval=float(os.environ.get("AGROAI_WRITE_BEHIND_INTERVAL", 0.5)),
+    )
+
+def record_prediction(conn, user_id, crop_type, predicted_class, confidence):
+    if prediction_writer is not None:
+        prediction_writer.submit(user_id, crop_type, predicted_class, confidence)
+    else:
+        db.insert_prediction(conn, user_id, crop_type, predicted_class, confidence)
+
+def prediction_history(conn, user_id):
+    """Recent predictions and statistics, including the user's own not-yet-flushed rows"""
+    source = prediction_writer if prediction_writer is not None else db
+    return source.recent_predictions(conn, user_id), source.prediction_summary(conn, user_id)
+
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute per-user prediction statistics from the predictions table"""
+    conn = db_pool.checkout()
+    try:
+        with conn:
+            db.rebuild_prediction_stats(conn)
+    finally:
+        db_pool.checkin(conn)
+    print("Prediction statistics rebuilt.")
+
+def chart_data_for(summary):
+    """Healthy/diseased chart values from the user's maintained prediction summary"""
+    values = [summary.healthy, summary.diseased] if summary else [0, 0]
+    return {"labels": ["Healthy", "Diseased"], "values": values}
+
 # ----------------- HELPERS -----------------
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def transcribe_audio_groq(filepath):
+MAX_AUDIO_BYTES = int(os.environ.get("AGROAI_MAX_AUDIO_BYTES", 10 * 1024 * 1024))
+MAX_AUDIO_SECONDS = int(os.environ.get("AGROAI_MAX_AUDIO_SECONDS", 120))
+
+def transcribe_audio_groq(filename, data):
     try:
-        with open(filepath, "rb") as f:
-            response = groq_client.audio.transcriptions.create(
+        with metrics.timer("agroai_upstream_seconds", errors="agroai_upstream_errors_total", service="groq_transcribe"):
+            response = get_groq_client().audio.transcriptions.create(
                 model="whisper-large-v3-turbo",
-                file=f,
+                file=(filename, data),
             )
-            return response.text
+        return response.text
     except Exception as e:
         print(f"Error in transcription: {e}")
         return "Error transcribing audio."
 
-def get_answer_groq(question):
-    try:
-        response = groq_client.chat.completions.create(
-            model="openai/gpt-oss-20b",
-            messages=[
-                {"role": "system", "content": "You are a helpful agriculture chatbot for Indian farmers."},
-                {"role": "user", "content": question}
-            ],
+GROQ_CHAT_MODEL = "openai/gpt-oss-20b"
+CHAT_SYSTEM_PROMPT = "You are a helpful agriculture chatbot for Indian farmers."
+
+# Repeated questions are answered from cache; identical in-flight questions share one call
+answer_cache = AnswerCache(
+    os.environ.get("AGROAI_ANSWER_CACHE", "answer_cache.json"),
+    max_entries=int(os.environ.get("AGROAI_ANSWER_CACHE_SIZE", 5000)),
+    ttl=int(os.environ.get("AGROAI_ANSWER_CACHE_TTL", 7 * 24 * 3600)),
+)
+
+def chat_messages(question):
+    return [
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+        {"role": "user", "content": question}
+    ]
+
+def ask_groq(question):
+    with metrics.timer("agroai_upstream_seconds", errors="agroai_upstream_errors_total", service="groq_chat"):
+        response = get_groq_client().chat.completions.create(
+            model=GROQ_CHAT_MODEL,
+            messages=chat_messages(question),
         )
-        return response.choices[0].message.content.strip()
+    return response.choices[0].message.content.strip()
+
+def stream_answer_groq(question, language=None):
+    """Yield answer text as it is generated; a cached answer is yielded whole
+
+    Identical questions asked while one is streaming wait for that stream's answer
+    instead of making their own call.
+    """
+    def produce():
+        # Covers the whole stream, including the time the client takes to consume it
+        with metrics.timer("agroai_upstream_seconds", errors="agroai_upstream_errors_total", service="groq_chat_stream"):
+            stream = get_groq_client().chat.completions.create(
+                model=GROQ_CHAT_MODEL,
+                messages=chat_messages(question),
+                stream=True,
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+
+    key = AnswerCache.key(question, GROQ_CHAT_MODEL, CHAT_SYSTEM_PROMPT, language)
+    yield from answer_cache.stream(key, produce)
+
+def get_answer_groq(question, language=None):
+    try:
+        key = AnswerCache.key(question, GROQ_CHAT_MODEL, CHAT_SYSTEM_PROMPT, language)
+        return answer_cache.get_or_compute(key, lambda: ask_groq(question))
     except Exception as e:
         print(f"Error in getting answer: {e}")
         return "Error generating answer."
@@ -721,52 +819,97 @@ def clean_text_for_audio(text):
     # Remove markdown symbols for clearer TTS
     return re.sub(r'[*#`_\-|>\n]+', ' ', text).strip()
 
-def text_to_audio(text, filename):
+def synthesize_speech(text, lang="en", tld="com"):
+    """MP3 bytes for one chunk of text"""
+    buffered = io.BytesIO()
+    with metrics.timer("agroai_upstream_seconds", errors="agroai_upstream_errors_total", service="gtts"):
+        gtts.gTTS(text, lang=lang, tld=tld).write_to_fp(buffered)
+    return buffered.getvalue()
+
+TTS_LANG = os.environ.get("AGROAI_TTS_LANG", "en")
+TTS_TLD = os.environ.get("AGROAI_TTS_TLD", "com")  # gTTS accent
+TTS_WAIT_SECONDS = float(os.environ.get("AGROAI_TTS_WAIT", 10))
+audio_store = AudioStore(
+    os.path.join("static", "audio"),
+    max_bytes=int(os.environ.get("AGROAI_AUDIO_CACHE_BYTES", 256 * 1024 * 1024)),
+    janitor_interval=int(os.environ.get("AGROAI_AUDIO_JANITOR_SECONDS", 300)),
+)
+speech_jobs = SpeechJobs(
+    synthesize_speech,
+    audio_store,
+    max_workers=int(os.environ.get("AGROAI_TTS_WORKERS", 2)),
+    chunk_workers=int(os.environ.get("AGROAI_TTS_CHUNK_WORKERS", 4)),
+    chunk_chars=int(os.environ.get("AGROAI_TTS_CHUNK_CHARS", 500)),
+    ttl=int(os.environ.get("AGROAI_TTS_TTL", 600)),
+)
+
+def text_to_audio(text):
+    """Start background synthesis of an answer and return the job ID"""
+    return speech_jobs.submit(clean_text_for_audio(text), TTS_LANG, TTS_TLD)
+
+def load_image_tensor(path, size=224):
+    """Preprocessed model input for an image file"""
+    with open(path, "rb") as f:
+        return to_model_input(decode_leaf_image(f, size))
+
+def with_current_model(crop_type, crop, call):
+    """call(crop), retried on the current model if a hot reload closed `crop`'s workers meanwhile"""
     try:
-        cleaned_text = clean_text_for_audio(text)
-        tts = gTTS(cleaned_text)
-        tts.save(f"static/audio/{filename}.mp3")
-    except Exception as e:
-        print(f"Error in text-to-audio: {e}")
-
-# Grad-CAM function for disease detection visualization
-def generate_gradcam(model, input_tensor, target_layer, target_class=None):
-    model.eval()
-    gradients = []
-    activations = []
-
-    def forward_hook(module, input, output):
-        activations.append(output.detach())
-
-    def backward_hook(module, grad_in, grad_out):
-        gradients.append(grad_out[0].detach())
-
-    handle_fw = target_layer.register_forward_hook(forward_hook)
-    handle_bw = target_layer.register_backward_hook(backward_hook)
-
-    output = model(input_tensor)
-    if target_class is None:
-        target_class = output.argmax(dim=1).item()
-
-    loss = output[0, target_class]
-    model.zero_grad()
-    loss.backward()
-
-    grad = gradients[0][0]  # [C, H, W]
-    act = activations[0][0]  # [C, H, W]
-
-    weights = grad.mean(dim=(1, 2))  # Global Average Pooling
-    cam = torch.zeros(act.shape[1:], dtype=torch.float32).to(DEVICE)
-    for i, w in enumerate(weights):
-        cam += w * act[i]
-
-    cam = F.relu(cam)
-    cam = cam.cpu().numpy()
-    cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)  # Normalize 0-1
-
-    handle_fw.remove()
-    handle_bw.remove()
-    return cam, target_class
+        return call(crop)
+    except BatcherClosed:
+        crop = model_registry.get(crop_type)
+        if crop is None:
+            raise RuntimeError(f"{crop_type} model is not available")
+        return call(crop)
+
+def render_heatmap(job):
+    """Run Grad-CAM for a parked detection and return the stored overlay's file name"""
+    predicted_class = job["predicted_class"]
+    crop = model_registry.get(job["crop"])
+    if crop is None:
+        raise RuntimeError(f"{job['crop']} model is not available")
+    cam = None
+    if 'healthy' not in predicted_class.lower():  # Healthy leaves only get a tint, no Grad-CAM
+        with metrics.timer("agroai_detect_stage_seconds", stage="gradcam"):
+            # Explain the class shown next to the heatmap, not whatever a fresh forward pass picks
+            item = (to_model_input(job["rgb"]), crop.spec.class_names.index(predicted_class))
+            _, cam = with_current_model(job["crop"], crop, lambda current: current.batcher(item))
+    with metrics.timer("agroai_detect_stage_seconds", stage="overlay"):
+        overlay = make_overlay(job["rgb"], cam, predicted_class, crop.spec.colormap(predicted_class))
+    with metrics.timer("agroai_detect_stage_seconds", stage="encode"):
+        name = overlay_store.put(*encode_overlay(overlay, OVERLAY_FORMAT, OVERLAY_QUALITY))
+    result_cache.update(job["cache_key"], overlay=name)
+    return name
+
+# Encoded overlays are content-addressed on disk and served with long-lived cache headers
+OVERLAY_FORMAT = os.environ.get("AGROAI_OVERLAY_FORMAT", "webp")  # webp | jpeg | png
+OVERLAY_QUALITY = int(os.environ.get("AGROAI_OVERLAY_QUALITY", 80))
+OVERLAY_CACHE_SECONDS = 365 * 24 * 3600
+app.config['OVERLAY_FOLDER'] = 'Overlays'
+overlay_store = OverlayStore(
+    app.config['OVERLAY_FOLDER'],
+    max_bytes=int(os.environ.get("AGROAI_OVERLAY_MAX_MB", 256)) * 1024 * 1024,
+)
+
+# Detection results keyed by image fingerprint, crop and model version
+app.config['RESULT_CACHE_FOLDER'] = 'ResultCache'
+result_cache = ResultCache(
+    app.config['RESULT_CACHE_FOLDER'],
+    ttl=int(os.environ.get("AGROAI_RESULT_CACHE_TTL", 24 * 3600)),
+    max_memory_entries=int(os.environ.get("AGROAI_RESULT_CACHE_MEMORY", 2048)),
+    max_disk_entries=int(os.environ.get("AGROAI_RESULT_CACHE_DISK", 50000)),
+)
+
+# Grad-CAM overlays are computed off the /detect critical path and kept for a while
+HEATMAP_TTL_SECONDS = int(os.environ.get("AGROAI_HEATMAP_TTL", 600))
+HEATMAP_WAIT_SECONDS = float(os.environ.get("AGROAI_HEATMAP_WAIT", 10))
+heatmap_store = HeatmapStore(
+    render_heatmap,
+    max_workers=int(os.environ.get("AGROAI_HEATMAP_WORKERS", 2)),
+    ttl=HEATMAP_TTL_SECONDS,
+    # Shared by worker processes (set by serve.py) so any of them can render a parked heatmap
+    root=os.environ.get("AGROAI_HEATMAP_DIR") or None,
+)
 
 # ----------------- ROUTES -----------------
 @app.route('/')
@@ -792,7 +935,114 @@ def weather():
         return redirect(url_for('login_signup'))
     return render_template('weather.html', username=session.get("username"))
 
+# Browsers ask the server, which asks the provider once per location tile and TTL
+WEATHER_PROVIDER = os.environ.get("AGROAI_WEATHER_PROVIDER", "openweathermap")
+OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY")
+if WEATHER_PROVIDER == "stub":
+    # Made-up data for offline development and tests; never chosen implicitly
+    print("Weather: serving stub data (AGROAI_WEATHER_PROVIDER=stub)")
+    weather_provider = StubProvider()
+elif WEATHER_PROVIDER != "openweathermap":
+    raise ValueError(f"unknown weather provider {WEATHER_PROVIDER!r}, choose openweathermap or stub")
+elif OPENWEATHER_API_KEY:
+    weather_provider = OpenWeatherMapProvider(
+        OPENWEATHER_API_KEY,
+        timeout=float(os.environ.get("AGROAI_WEATHER_TIMEOUT", 5)),
+        max_connections=int(os.environ.get("AGROAI_WEATHER_CONNECTIONS", 20)),
+    )
+else:
+    print("Warning: OPENWEATHER_API_KEY is not set, weather features will be disabled.")
+    weather_provider = None
+
+def fetch_weather(kind, **query):
+    with metrics.timer("agroai_upstream_seconds", errors="agroai_upstream_errors_total", service="weather"):
+        return weather_provider.fetch(kind, **query)
+
+weather_cache = WeatherCache(
+    fetch_weather,
+    ttls={
+        "weather": int(os.environ.get("AGROAI_WEATHER_TTL", 10 * 60)),
+        "forecast": int(os.environ.get("AGROAI_FORECAST_TTL", 60 * 60)),
+    },
+    tile_degrees=float(os.environ.get("AGROAI_WEATHER_TILE_DEGREES", 0.1)),
+)
+WEATHER_KINDS = {"current": "weather", "forecast": "forecast"}
+
+@app.route('/weather/<kind>')
+def weather_data(kind):
+    """Provider JSON for `lat`/`lon` (or, for current weather, city `q`), cached per tile"""
+    if "user_id" not in session:
+        return jsonify({'error': 'Please log in.'}), 401
+    if kind not in WEATHER_KINDS:
+        return jsonify({'error': 'Weather kind must be "current" or "forecast".'}), 404
+    if weather_provider is None:
+        return jsonify({'error': 'Weather service is not configured.'}), 503
+    city = request.args.get("q")
+    try:
+        if city is not None and kind == "current":
+            data = weather_cache.get_city(city)
+        else:
+            data, _ = weather_cache.get(WEATHER_KINDS[kind], request.args.get("lat"), request.args.get("lon"))
+    except WeatherRejected as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        if status == 404:
+            return jsonify({'cod': 404, 'error': 'Location not found.'}), 404
+        print(f"Error fetching weather: {e}")
+        return jsonify({'error': 'Weather service is unavailable.'}), 502
+    response = jsonify(data)
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
+
+def prefill_weather(lat, lon):
+    """Current temperature and humidity for the irrigation form, or None"""
+    if not lat or not lon or weather_provider is None:
+        return None
+    try:
+        return current_conditions(weather_cache.get("weather", lat, lon)[0])
+    except Exception as e:
+        print(f"Error prefilling weather: {e}")
+        return None
+
 # ----------------- DISEASE DETECTION -----------------
+def classify_leaf(crop, crop_type, rgb):
+    """(cache key, result) for a decoded image; repeat uploads are answered from the fingerprint cache
+
+    The result holds predicted_class, confidence (percent) and per-class probabilities.
+    """
+    with metrics.timer("agroai_detect_stage_seconds", stage="cache_lookup"):
+        cache_key = result_cache.key(rgb, crop_type, f"{crop.version}-{crop.backend}")
+        cached = result_cache.get(cache_key)
+    if cached is None or "probabilities" not in cached:
+        # Classification takes the fast backend; the Grad-CAM overlay is rendered later on request
+        with metrics.timer("agroai_detect_stage_seconds", stage="preprocess"):
+            model_input = to_model_input(rgb)
+        with metrics.timer("agroai_detect_stage_seconds", stage="forward"):
+            probabilities = with_current_model(crop_type, crop, lambda current: current.classifier(model_input))
+        class_idx = int(probabilities.argmax())
+        cached = {
+            **(cached or {}),
+            "predicted_class": crop.spec.class_names[class_idx],
+            "confidence": float(probabilities[class_idx]) * 100,  # Convert to percentage
+            "probabilities": [float(p) for p in probabilities],
+        }
+        result_cache.put(cache_key, cached)
+    return cache_key, cached
+
+def park_heatmap(crop_type, rgb, cache_key, result, owner, external=False):
+    """(heatmap ID, URL) for a detection: the stored overlay if one exists, else a deferred render"""
+    if result.get("overlay") and overlay_store.path(result["overlay"]):
+        return None, url_for("overlay", name=result["overlay"], _external=external)
+    heatmap_id = heatmap_store.add({
+        "crop": crop_type,
+        "rgb": rgb,
+        "predicted_class": result["predicted_class"],
+        "cache_key": cache_key,
+    }, owner=owner)
+    return heatmap_id, url_for("detect_heatmap", heatmap_id=heatmap_id, _external=external)
+
 @app.route('/detect', methods=['POST'])
 def detect():
     if "user_id" not in session:
@@ -806,107 +1056,177 @@ def detect():
         flash("Please upload an image and select crop.", "danger")
         return redirect(url_for("dashboard"))
 
-    if crop_type not in ['Tomato', 'Potato']:
-        flash("Disease detection currently available only for Tomato and Potato.", "danger")
+    if crop_type not in model_registry.crops():
+        flash(f"Disease detection currently available only for {' and '.join(model_registry.crops())}.", "danger")
         return redirect(url_for("dashboard"))
 
-    model = tomato_model if crop_type == 'Tomato' else potato_model
-    class_names = tomato_class_names if crop_type == 'Tomato' else potato_class_names
-
-    if model is None:
+    crop = model_registry.get(crop_type)
+    if crop is None:
         flash(f"{crop_type} disease detection model is not available.", "danger")
         return redirect(url_for("dashboard"))
 
     try:
-        # Read and transform image
-        image = Image.open(file).convert("RGB")
-        input_tensor = transform(image).unsqueeze(0).to(DEVICE)
-
-        # Find last convolutional layer dynamically
-        target_layer = None
-        for name, module in reversed(list(model.named_modules())):
-            if isinstance(module, torch.nn.Conv2d):
-                target_layer = module
-                break
-
-        if target_layer is None:
-            flash("Could not find convolutional layer for Grad-CAM.", "danger")
-            return redirect(url_for("dashboard"))
-
-        # Generate Grad-CAM and prediction
-        with torch.no_grad():
-            output = model(input_tensor)
-            probabilities = torch.softmax(output, dim=1)
-            confidence, pred = torch.max(probabilities, 1)
-            class_idx = pred.item()
-            confidence = confidence.item() * 100  # Convert to percentage
-
-        cam, pred_idx = generate_gradcam(model, input_tensor, target_layer)
-        predicted_class = class_names[class_idx]
+        # Decode near model resolution; the same pixels feed the model and the overlay
+        with metrics.timer("agroai_detect_stage_seconds", stage="decode"):
+            rgb = decode_leaf_image(file, crop.spec.input_size)
+
+        cache_key, cached = classify_leaf(crop, crop_type, rgb)
+        predicted_class = cached["predicted_class"]
+        confidence = cached["confidence"]
         display_class = predicted_class.replace('_', ' ')
 
         # Get disease information
         disease_info = get_disease_info(predicted_class)
 
-        # Resize image and CAM
-        img_resized = image.resize((224, 224))
-        img_np = np.array(img_resized)
+        heatmap_id, heatmap_url = park_heatmap(crop_type, rgb, cache_key, cached, session["user_id"])
 
-        # Overlay heatmap
-        if 'healthy' in predicted_class.lower():
-            overlay = cv2.addWeighted(img_np, 0.7, np.full_like(img_np, (0, 255, 0)), 0.3, 0)
-        else:
-            cam_uint8 = np.uint8(255 * cam)
-            cam_resized = cv2.resize(cam_uint8, (img_np.shape[1], img_np.shape[0]))
-            cmap = CLASS_COLORMAPS.get(predicted_class, cv2.COLORMAP_JET)
-            heatmap = cv2.applyColorMap(cam_resized, cmap)
-            heatmap = cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB)
-            overlay = cv2.addWeighted(img_np, 0.6, heatmap, 0.4, 0)
-
-        # Convert overlay to PIL Image
-        result_img = Image.fromarray(overlay)
-
-        # Convert to base64 for HTML rendering
-        buffered = io.BytesIO()
-        result_img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-
-        # Store prediction in database
-        with sqlite3.connect("agroai.db") as conn:
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO predictions (user_id, crop_type, predicted_class, confidence)
-                VALUES (?, ?, ?, ?)
-            """, (session["user_id"], crop_type, predicted_class, confidence))
-            conn.commit()
-
-        # Fetch recent predictions
-        with sqlite3.connect("agroai.db") as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT created_at, crop_type, predicted_class, confidence
-                FROM predictions
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT 5
-            """, (session["user_id"],))
-            recent_predictions = c.fetchall()
+        # Store prediction and fetch recent history on the request's single connection
+        with metrics.timer("agroai_detect_stage_seconds", stage="db"):
+            conn = get_db()
+            record_prediction(conn, session["user_id"], crop_type, predicted_class, confidence)
+            recent_predictions, summary = prediction_history(conn, session["user_id"])
         # Get disease information
         print(f"Predicted Class: {predicted_class}, Disease Info: {disease_info}")
 
         return render_template("dashboard.html", 
                      username=session.get("username"), 
-                     result_image=img_str, 
+                     result_image=None,
+                     heatmap_id=heatmap_id,
+                     heatmap_url=heatmap_url,
                      predicted_class=display_class,
                      confidence=f"{confidence:.2f}%",
                      recent_predictions=recent_predictions,
-                     chart_data={"labels": ["Healthy", "Diseased"], "values": [35, 7]},
+                     chart_data=chart_data_for(summary),
+                     prediction_summary=summary,
                      disease_info=disease_info)  # Add disease_info to template variables
 
+    except ImageRejected as e:
+        flash(str(e), "danger")
+        return redirect(url_for("dashboard"))
     except Exception as e:
         print(f"Error in disease detection: {e}")
         flash("Error processing image. Please try again.", "danger")
         return redirect(url_for("dashboard"))
+def submit_classification(crop_type, crop, model_input):
+    # A survey holds its crop for hundreds of images; after a reload they go to the new model
+    return with_current_model(crop_type, crop, lambda current: current.classifier.submit(model_input))
+
+SURVEY_MAX_IMAGES = int(os.environ.get("AGROAI_SURVEY_MAX_IMAGES", 500))
+SURVEY_MAX_BYTES = int(os.environ.get("AGROAI_SURVEY_MAX_BYTES", 512 * 1024 * 1024))
+
+@app.route('/detect/survey', methods=['POST'])
+def detect_survey():
+    """Bulk detection over many images (`files`) and/or a zip (`archive`); JSON or CSV (`format=csv`) report"""
+    if "user_id" not in session:
+        return jsonify({'error': 'Please log in.'}), 401
+    if request.content_length and request.content_length > SURVEY_MAX_BYTES:
+        return jsonify({'error': f'Upload is larger than {SURVEY_MAX_BYTES // (1024 * 1024)} MB.'}), 413
+
+    crop_type = request.form.get("crop")
+    if crop_type not in model_registry.crops():
+        return jsonify({'error': f"Choose a crop: {', '.join(model_registry.crops())}."}), 400
+    crop = model_registry.get(crop_type)
+    if crop is None:
+        return jsonify({'error': f'{crop_type} disease detection model is not available.'}), 503
+
+    files = request.files.getlist("files")
+    archive = request.files.get("archive")
+    if not any(f.filename for f in files) and not archive:
+        return jsonify({'error': 'Upload images as "files" or a zip as "archive".'}), 400
+    with_heatmaps = request.form.get("heatmaps") == "1"
+    model_version = f"{crop.version}-{crop.backend}"
+
+    rows, db_rows = [], []
+    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # Same format as CURRENT_TIMESTAMP
+    images = survey.iter_uploads(files, archive.stream if archive else None, SURVEY_MAX_IMAGES)
+    try:
+        # A window of two batches keeps the classifier worker running full batches
+        for name, rgb, outcome in survey.classify_stream(
+                images,
+                lambda file: decode_leaf_image(file, crop.spec.input_size),
+                lambda rgb: submit_classification(crop_type, crop, to_model_input(rgb)),
+                window=2 * BATCH_MAX_SIZE):
+            if isinstance(outcome, Exception):
+                rows.append({"file": name, "error": str(outcome)})
+                continue
+            class_idx = int(outcome.argmax())
+            predicted_class = crop.spec.class_names[class_idx]
+            confidence = float(outcome[class_idx]) * 100
+            row = {
+                "file": name,
+                "predicted_class": predicted_class,
+                "confidence": round(confidence, 2),
+                "healthy": db.is_healthy(predicted_class),
+            }
+            if with_heatmaps:
+                cache_key = result_cache.key(rgb, crop_type, model_version)
+                if result_cache.get(cache_key) is None:
+                    # Same entry classify_leaf writes; one written by /detect (maybe with its overlay) is kept
+                    result_cache.put(cache_key, {
+                        "predicted_class": predicted_class,
+                        "confidence": confidence,
+                        "probabilities": [float(p) for p in outcome],
+                    })
+                heatmap_id = heatmap_store.add({
+                    "crop": crop_type,
+                    "rgb": rgb,
+                    "predicted_class": predicted_class,
+                    "cache_key": cache_key,
+                }, owner=session["user_id"])
+                row["heatmap_url"] = url_for("detect_heatmap", heatmap_id=heatmap_id)
+            rows.append(row)
+            db_rows.append((session["user_id"], crop_type, predicted_class, confidence, created_at))
+    except survey.SurveyRejected as e:
+        return jsonify({'error': str(e)}), 400
+
+    if db_rows:
+        with metrics.timer("agroai_detect_stage_seconds", stage="db"):
+            db.insert_predictions(get_db(), db_rows)
+    summary = survey.summarize(rows)
+
+    if request.form.get("format") == "csv":
+        headers = {
+            "Content-Disposition": f'attachment; filename="{crop_type.lower()}_survey.csv"',
+            "X-Survey-Images": str(summary["images"]),
+            "X-Survey-Healthy": str(summary["healthy"]),
+            "X-Survey-Diseased": str(summary["diseased"]),
+            "X-Survey-Failed": str(summary["failed"]),
+        }
+        return Response(survey.to_csv(rows), mimetype="text/csv", headers=headers)
+    return jsonify({"crop": crop_type, "model_version": model_version, "summary": summary, "images": rows})
+
+@app.route('/detect/<heatmap_id>/heatmap')
+def detect_heatmap(heatmap_id):
+    user_id = session.get("user_id") or api_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Please log in.'}), 401
+
+    future = heatmap_store.request(heatmap_id, owner=user_id)
+    if future is None:
+        return jsonify({'error': 'Heatmap not found or expired.'}), 404
+    try:
+        name = future.result(timeout=HEATMAP_WAIT_SECONDS)
+    except FutureTimeoutError:
+        return jsonify({'status': 'pending'}), 202, {'Retry-After': '1'}
+    except Exception as e:
+        print(f"Error generating heatmap: {e}")
+        return jsonify({'error': 'Could not generate heatmap.'}), 500
+    return redirect(url_for('overlay', name=name))
+
+@app.route('/overlays/<name>')
+def overlay(name):
+    path = overlay_store.path(name)
+    if path is None:
+        return jsonify({'error': 'Overlay not found.'}), 404
+    try:
+        response = send_file(path, mimetype=MIMETYPES[name.rsplit('.', 1)[1]],
+                             etag=name.split('.', 1)[0], max_age=OVERLAY_CACHE_SECONDS, conditional=True)
+    except FileNotFoundError:  # Evicted between lookup and send
+        return jsonify({'error': 'Overlay not found.'}), 404
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 # ----------------- IRRIGATION -----------------
 @app.route('/irrigation', methods=['GET', 'POST'])
 def irrigation():
@@ -933,42 +1253,54 @@ def irrigation():
         except ValueError:
             flash("Field size, temperature, and humidity must be numbers.", "danger")
             return redirect(url_for("irrigation"))
+        if not all(math.isfinite(value) for value in (field_size, temperature, humidity)):
+            flash("Field size, temperature, and humidity must be numbers.", "danger")
+            return redirect(url_for("irrigation"))
+
+        plan = irrigation_planner.plan_irrigation(crop_type, field_size, soil_type, growth_stage, temperature, humidity)
+        db.insert_irrigation_plan(get_db(), session["user_id"], crop_type, field_size, soil_type, growth_stage,
+                                  temperature, humidity, plan['liters_per_day'], plan['times_per_week'],
+                                  plan['minutes_per_session'], plan['best_time'])
+
+        return render_template('irrigation.html', username=session.get("username"), plan=plan)
+
+    return render_template('irrigation.html', username=session.get("username"), plan=None,
+                           weather=prefill_weather(request.args.get("lat"), request.args.get("lon")))
 
-        # Water calculation
-        crop_water_needs = {'tomato': 600, 'potato': 500, 'wheat': 450, 'rice': 1200, 'maize': 550, 'cotton': 700}
-        soil_factor = {'clay': 0.8, 'sandy': 1.2, 'loamy': 1.0, 'silt': 0.9}
-        growth_factor = {'seedling': 0.6, 'vegetative': 0.8, 'flowering': 1.0, 'fruiting': 0.9}
-
-        water_need = crop_water_needs.get(crop_type, 500) * field_size * \
-                     soil_factor.get(soil_type, 1.0) * growth_factor.get(growth_stage, 1.0)
-        if temperature > 30:
-            water_need *= 1.2
-        if humidity < 50:
-            water_need *= 1.1
-
-        times_per_week = 4 if temperature > 25 else 3
-        minutes_per_session = round(water_need / (times_per_week * 10))
-        best_time = 'Evening (6-8 PM)' if temperature > 25 else 'Morning (5-8 AM)'
-
-        # Store in database
-        with sqlite3.connect("agroai.db") as conn:
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO irrigation_plans (user_id, crop_type, field_size, soil_type, growth_stage, temperature, humidity, liters_per_day, times_per_week, minutes_per_session, best_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (session["user_id"], crop_type, field_size, soil_type, growth_stage, temperature, humidity, round(water_need), times_per_week, minutes_per_session, best_time))
-            conn.commit()
-
-        return render_template('irrigation.html', 
-                             username=session.get("username"), 
-                             plan={
-                                 'liters_per_day': round(water_need),
-                                 'times_per_week': times_per_week,
-                                 'minutes_per_session': minutes_per_session,
-                                 'best_time': best_time
-                             })
-
-    return render_template('irrigation.html', username=session.get("username"), plan=None)
+IRRIGATION_BULK_MAX_FIELDS = int(os.environ.get("AGROAI_IRRIGATION_BULK_MAX_FIELDS", 50000))
+
+@app.route('/irrigation/bulk', methods=['POST'])
+def irrigation_bulk():
+    """Plans for many fields: a CSV or JSON upload (`fields`) or a JSON array body; streams back CSV"""
+    if "user_id" not in session:
+        return jsonify({'error': 'Please log in.'}), 401
+
+    upload = request.files.get("fields")
+    if upload and upload.filename:
+        text = upload.read().decode("utf-8-sig", errors="replace")
+        fmt = "json" if upload.filename.lower().endswith(".json") else "csv"
+    else:
+        text = request.get_data(as_text=True)
+        fmt = "json" if request.is_json else "csv"
+    try:
+        fields = irrigation_planner.read_fields(text, fmt, IRRIGATION_BULK_MAX_FIELDS)
+    except irrigation_planner.FieldsRejected as e:
+        return jsonify({'error': str(e)}), 400
+    if not fields:
+        return jsonify({'error': 'Upload at least one field as "fields" (CSV or JSON).'}), 400
+
+    plans = irrigation_planner.plan_irrigation_bulk(fields)
+    db.insert_irrigation_plans(get_db(), session["user_id"], (
+        tuple(field[column] for column in irrigation_planner.FIELD_COLUMNS) +
+        tuple(plan[column] for column in irrigation_planner.PLAN_COLUMNS)
+        for field, plan in irrigation_planner.plan_rows(fields, plans)))
+
+    headers = {
+        "Content-Disposition": 'attachment; filename="irrigation_plans.csv"',
+        "X-Irrigation-Fields": str(len(fields)),
+    }
+    return Response(stream_with_context(irrigation_planner.iter_csv(fields, plans)),
+                    mimetype="text/csv", headers=headers)
 
 # ----------------- LOGIN / SIGNUP -----------------
 @app.route('/login_signup', methods=['GET', 'POST'])
@@ -987,11 +1319,7 @@ def login_signup():
                 flash("Passwords do not match.", "danger")
                 return redirect(url_for("login_signup"))
             try:
-                with sqlite3.connect("agroai.db") as conn:
-                    c = conn.cursor()
-                    c.execute("INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
-                              (username, email, generate_password_hash(password)))
-                    conn.commit()
+                db.create_user(get_db(), username, email, generate_password_hash(password))
                 flash("Account created successfully! Please log in.", "success")
             except sqlite3.IntegrityError:
                 flash("Email already exists!", "danger")
@@ -1003,13 +1331,10 @@ def login_signup():
             if not all([email, password]):
                 flash("Please fill in all fields.", "danger")
                 return redirect(url_for("login_signup"))
-            with sqlite3.connect("agroai.db") as conn:
-                c = conn.cursor()
-                c.execute("SELECT id, username, password FROM users WHERE email=?", (email,))
-                user = c.fetchone()
-            if user and check_password_hash(user[2], password):
-                session["user_id"] = user[0]
-                session["username"] = user[1]
+            user = db.find_user_by_email(get_db(), email)
+            if user and check_password_hash(user.password_hash, password):
+                session["user_id"] = user.id
+                session["username"] = user.username
                 flash("Login successful!", "success")
                 return redirect(url_for("dashboard"))
             else:
@@ -1025,24 +1350,16 @@ def dashboard():
     
     # Fetch recent predictions for the dashboard
     recent_predictions = []
+    summary = None
     try:
-        with sqlite3.connect("agroai.db") as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT created_at, crop_type, predicted_class, confidence
-                FROM predictions
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT 5
-            """, (session["user_id"],))
-            recent_predictions = c.fetchall()
+        recent_predictions, summary = prediction_history(get_db(), session["user_id"])
     except Exception as e:
         print(f"Error fetching predictions: {e}")
-    
-    chart_data = {"labels": ["Healthy", "Diseased"], "values": [35, 7]}
+
     return render_template('dashboard.html', 
                          username=session["username"], 
-                         chart_data=chart_data,
+                         chart_data=chart_data_for(summary),
+                         prediction_summary=summary,
                          recent_predictions=recent_predictions)
 
 @app.route('/logout')
@@ -1056,36 +1373,269 @@ def logout():
 def agroai():
     return render_template('chatbot.html')
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    answer = ""
-    voice_filename = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+def question_from_request():
+    """Question text from the chat form, transcribing an uploaded recording if present
 
+    Raises AudioRejected for recordings over the size/duration limits.
+    """
     if 'audio' in request.files:
         audio = request.files['audio']
         if audio and allowed_file(audio.filename):
-            filename = secure_filename(audio.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            audio.save(filepath)
-            transcription = transcribe_audio_groq(filepath)
-            answer = get_answer_groq(transcription)
-            text_to_audio(answer, voice_filename)
-
+            ext = audio.filename.rsplit('.', 1)[1].lower()
+            filename, data = prepare_for_transcription(audio.stream, ext, MAX_AUDIO_BYTES, MAX_AUDIO_SECONDS)
+            return transcribe_audio_groq(filename, data)
     elif 'text' in request.form:
-        question = request.form['text']
-        answer = get_answer_groq(question)
-        text_to_audio(answer, voice_filename)
+        return request.form['text']
+    return None
+
+def render_answer(answer):
+    # Convert Markdown to HTML for frontend
+    return markdown.markdown(answer, extensions=["tables"])
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    answer = ""
+
+    try:
+        question = question_from_request()
+    except AudioRejected as e:
+        return jsonify({'text': str(e)}), 400
+    if question:
+        answer = get_answer_groq(question, request.form.get('lang'))
 
     if answer:
-        # Convert Markdown to HTML for frontend
-        answer_html = markdown.markdown(answer, extensions=["tables"])
+        job_id = text_to_audio(answer)
         return jsonify({
-            'text': answer_html,
-            'voice': url_for('static', filename=f'audio/{voice_filename}.mp3')
+            'text': render_answer(answer),
+            'voice_job': job_id,
+            'voice_status': url_for('chat_voice', job_id=job_id)
         })
 
     return jsonify({'text': 'No valid input found'}), 400
 
+# Streaming chat re-renders the partial answer at most this often
+STREAM_RENDER_INTERVAL = float(os.environ.get("AGROAI_STREAM_RENDER_INTERVAL", 0.1))
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-sent events: 'delta' with the partial answer HTML, 'answer' with the full HTML, then 'done' with the speech job"""
+    try:
+        question = question_from_request()
+    except AudioRejected as e:
+        return jsonify({'text': str(e)}), 400
+    if not question:
+        return jsonify({'text': 'No valid input found'}), 400
+    language = request.form.get('lang')
+
+    def generate():
+        answer = ""
+        last_render = 0.0
+        try:
+            for delta in stream_answer_groq(question, language):
+                answer += delta
+                now = time.monotonic()
+                if now - last_render >= STREAM_RENDER_INTERVAL:
+                    last_render = now
+                    yield sse_event("delta", {"html": render_answer(answer)})
+        except Exception as e:
+            print(f"Error in streaming answer: {e}")
+            yield sse_event("error", {"text": "Error generating answer."})
+            return
+
+        answer = answer.strip()
+        yield sse_event("answer", {"html": render_answer(answer)})
+        job_id = text_to_audio(answer)
+        yield sse_event("done", {"voice_job": job_id, "voice_status": url_for('chat_voice', job_id=job_id)})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/chat/voice/<job_id>')
+def chat_voice(job_id):
+    """Readiness of a speech job: 200 with the audio URL, 202 while synthesising"""
+    future = speech_jobs.request(job_id)
+    if future is None:
+        # Started in another worker process (or expired here); its markers say how it went
+        state, filename = audio_store.wait(job_id, TTS_WAIT_SECONDS)
+        if state is None:
+            return jsonify({'error': 'Audio not found or expired.'}), 404
+        if state == "failed":
+            return jsonify({'status': 'failed', 'error': 'Could not generate audio.'}), 500
+        if state == "pending":
+            return jsonify({'status': 'pending'}), 202, {'Retry-After': '1'}
+        return jsonify({'status': 'ready', 'voice': url_for('static', filename=f'audio/{filename}')})
+    try:
+        filename = future.result(timeout=TTS_WAIT_SECONDS)
+    except FutureTimeoutError:
+        return jsonify({'status': 'pending'}), 202, {'Retry-After': '1'}
+    except Exception as e:
+        print(f"Error in text-to-audio: {e}")
+        return jsonify({'status': 'failed', 'error': 'Could not generate audio.'}), 500
+    return jsonify({'status': 'ready', 'voice': url_for('static', filename=f'audio/{filename}')})
+
+# ----------------- PRE-FORK SERVING -----------------
+def after_fork():
+    """Restart per-process state in a worker forked by serve.py
+
+    Threads and SQLite connections do not survive fork(); the parent closes its
+    connections before forking and each worker starts its own background threads.
+    """
+    model_registry.after_fork()
+    audio_store.start_janitor()
+    if weather_provider is not None:
+        weather_provider.after_fork()
+    if METRICS_DIR:
+        metrics.start_dumping(METRICS_DIR)
+    if prediction_writer is not None:
+        prediction_writer.after_fork()
+
+# ----------------- API v1 -----------------
+API_TOP_K = 3
+
+def api_user_id():
+    """User ID for the request's `Authorization: Bearer <token>` header, or None"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return db.user_id_for_token(get_db(), token.strip())
+
+def api_flag(name):
+    return request.values.get(name, "").lower() in ("1", "true", "yes")
+
+def api_error(message, status):
+    headers = {'WWW-Authenticate': 'Bearer'} if status == 401 else {}
+    return jsonify({'error': message}), status, headers
+
+@app.route('/api/v1/tokens', methods=['POST'])
+def api_create_token():
+    """Exchange email/password for a bearer token"""
+    data = request.get_json(silent=True) or request.form
+    email, password = data.get("email"), data.get("password")
+    user = db.find_user_by_email(get_db(), email) if email and password else None
+    if user is None or not check_password_hash(user.password_hash, password):
+        return api_error('Invalid email or password.', 401)
+    token = db.create_api_token(get_db(), user.id, data.get("name"))
+    return jsonify({'token': token, 'token_type': 'Bearer'}), 201
+
+@app.route('/api/v1/tokens', methods=['DELETE'])
+def api_revoke_token():
+    """Revoke the token the request is authenticated with"""
+    _, _, token = request.headers.get("Authorization", "").partition(" ")
+    if api_user_id() is None:
+        return api_error('Missing or invalid API token.', 401)
+    db.revoke_api_token(get_db(), token.strip())
+    return '', 204
+
+@app.route('/api/v1/detect', methods=['POST'])
+def api_detect():
+    """Compact JSON detection: class, confidence and top-k probabilities (0-1), model version
+
+    Optional form/query flags: top_k=N, heatmap=1 for a heatmap URL, disease_info=1.
+    No template is rendered and no history is read.
+    """
+    user_id = api_user_id()
+    if user_id is None:
+        return api_error('Missing or invalid API token.', 401)
+
+    file = request.files.get("file")
+    crop_type = request.form.get("crop")
+    if not file:
+        return api_error('Upload an image as "file".', 400)
+    if crop_type not in model_registry.crops():
+        return api_error(f"Choose a crop: {', '.join(model_registry.crops())}.", 400)
+    crop = model_registry.get(crop_type)
+    if crop is None:
+        return api_error(f'{crop_type} disease detection model is not available.', 503)
+    try:
+        top_k = max(1, min(int(request.values.get("top_k", API_TOP_K)), len(crop.spec.class_names)))
+    except ValueError:
+        return api_error('top_k must be an integer.', 400)
+
+    try:
+        with metrics.timer("agroai_detect_stage_seconds", stage="decode"):
+            rgb = decode_leaf_image(file, crop.spec.input_size)
+    except ImageRejected as e:
+        return api_error(str(e), 400)
+    try:
+        cache_key, result = classify_leaf(crop, crop_type, rgb)
+    except (BatcherClosed, FutureTimeoutError) as e:
+        print(f"Error in API detection: {e!r}")
+        return api_error('Detection is busy, please retry.', 503)
+    except Exception as e:
+        print(f"Error in API detection: {e}")
+        return api_error('Prediction failed.', 500)
+
+    probabilities = result["probabilities"]
+    ranked = sorted(range(len(probabilities)), key=probabilities.__getitem__, reverse=True)[:top_k]
+    predicted_class = result["predicted_class"]
+    payload = {
+        "crop": crop_type,
+        "class": predicted_class,
+        "label": predicted_class.replace('_', ' '),
+        "confidence": round(probabilities[ranked[0]], 4),
+        "healthy": db.is_healthy(predicted_class),
+        "top_k": [{"class": crop.spec.class_names[i], "probability": round(probabilities[i], 4)} for i in ranked],
+        "model_version": f"{crop.version}-{crop.backend}",
+    }
+    if api_flag("heatmap"):
+        _, payload["heatmap_url"] = park_heatmap(crop_type, rgb, cache_key, result, user_id, external=True)
+    if api_flag("disease_info"):
+        payload["disease_info"] = get_disease_info(predicted_class)
+
+    with metrics.timer("agroai_detect_stage_seconds", stage="db"):
+        record_prediction(get_db(), user_id, crop_type, predicted_class, result["confidence"])
+    return jsonify(payload)
+
+# ----------------- METRICS ENDPOINT -----------------
+COUNTER_STATS = {"hits", "misses", "coalesced", "memory_hits", "disk_hits"}
+
+@metrics.collector
+def collect_app_state():
+    """Cache and model gauges, read from the components' own stats"""
+    caches = {
+        "answer": answer_cache.stats(),
+        "result": result_cache.stats(),
+        "speech": speech_jobs.stats(),
+        "overlay": overlay_store.stats(),
+        "weather": weather_cache.stats(),
+    }
+    families = {}
+    for cache, stats in caches.items():
+        for key, value in stats.items():
+            if key in COUNTER_STATS:
+                name, kind = f"agroai_cache_{key}_total", "counter"
+            else:
+                name, kind = f"agroai_cache_{key}", "gauge"
+            families.setdefault((name, kind), []).append(({"cache": cache}, value))
+    result = [(name, kind, f"Cache {name[len('agroai_cache_'):]} (per process)", samples)
+              for (name, kind), samples in families.items()]
+
+    loaded = []
+    for crop, state in model_registry.status().items():
+        labels = {"crop": crop, "backend": state.get("backend", ""), "version": state.get("version", "")}
+        loaded.append((labels, 1 if state["loaded"] else 0))
+    result.append(("agroai_model_loaded", "gauge", "Whether the crop model is loaded", loaded))
+    if prediction_writer is not None:
+        result.append(("agroai_prediction_writes_pending", "gauge", "Predictions queued for write-behind",
+                       [({}, prediction_writer.pending_count())]))
+    return result
+
+@app.route('/metrics')
+def metrics_view():
+    return Response(metrics.render(METRICS_DIR), mimetype="text/plain; version=0.0.4")
+
+# ----------------- STARTUP REPORT -----------------
+@app.route('/startup-report')
+def startup_report_view():
+    return jsonify(startup_report())
+
+mark_booted()
+if os.environ.get("AGROAI_STARTUP_REPORT"):
+    print_startup_report()
+
 # ----------------- MAIN -----------------
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import shutil
+import subprocess
+import tempfile
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_DURATION_SECONDS = 120
+SAMPLE_RATE = 16000  # What the speech model works at; anything higher is wasted upload
+OPUS_BITRATE = "24k"
+
+# Containers that keep their index at the end of the file, so ffmpeg cannot read them from a pipe
+SEEKABLE_ONLY = {"m4a", "mp4", "mov"}
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+class AudioRejected(ValueError):
+    """Upload that is not a decodable recording within the size/duration limits"""
+
+
+def prepare_for_transcription(file, ext, max_bytes=MAX_UPLOAD_BYTES, max_seconds=MAX_DURATION_SECONDS):
+    """Read an upload into memory and return (filename, bytes) ready to send for transcription
+
+    With ffmpeg available the recording is resampled to 16 kHz mono Opus, which also
+    lets the duration be checked. Without it the original bytes are sent unchanged.
+    """
+    data = file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise AudioRejected(f"Recording is larger than {max_bytes // (1024 * 1024)} MB.")
+    if not data:
+        raise AudioRejected("Recording is empty.")
+    if FFMPEG is None:
+        return f"speech.{ext}", data
+
+    pcm = _decode_pcm(data, ext, max_seconds)
+    if len(pcm) > max_seconds * SAMPLE_RATE * 2:
+        raise AudioRejected(f"Recording is longer than {max_seconds} seconds.")
+    opus = _run_ffmpeg(["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "pipe:0",
+                        "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip",
+                        "-f", "ogg", "pipe:1"], pcm)
+    return "speech.ogg", opus
+
+
+def _decode_pcm(data, ext, max_seconds):
+    # Decode one second past the limit: enough to tell the recording is too long
+    output = ["-t", str(max_seconds + 1), "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+    if ext not in SEEKABLE_ONLY:
+        return _run_ffmpeg(["-i", "pipe:0"] + output, data)
+    with tempfile.NamedTemporaryFile(suffix=f".{ext}") as f:
+        f.write(data)
+        f.flush()
+        return _run_ffmpeg(["-i", f.name] + output)
+
+
+def _run_ffmpeg(args, data=None):
+    try:
+        result = subprocess.run([FFMPEG, "-nostdin", "-hide_banner", "-loglevel", "error"] + args,
+                                input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=60, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error converting audio: {e.stderr.decode(errors='replace').strip()}")
+        raise AudioRejected("File is not a supported audio recording.")
+    except subprocess.TimeoutExpired:
+        raise AudioRejected("Recording took too long to process.")
+    if not result.stdout:
+        raise AudioRejected("Recording contains no audio.")
+    return result.stdout
@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatcherClosed(RuntimeError):
+    """Submitted to a batcher whose worker has stopped, e.g. a model replaced by a hot reload"""
+
+
+class MicroBatcher:
+    """Collects concurrent single-item requests into batches for one worker thread.
+
+    `run_batch` receives a list of items and must return a list of results in the
+    same order. A batch is dispatched as soon as it holds `max_batch_size` items or
+    `max_wait_ms` has passed since its first item arrived. Items submitted before
+    `close()` are still served; later submissions raise BatcherClosed.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=8, max_wait_ms=10, timeout=60.0):
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.timeout = timeout  # Default wait in __call__, so a stuck batch cannot hang a request forever
+        self._run_batch = run_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        with self._lock:
+            # Checked under the lock so nothing can be queued behind the stop sentinel
+            if self._closed:
+                raise BatcherClosed(f"{self.name} batcher is closed")
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(self.timeout if timeout is None else timeout)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            futures = [future for _, future in batch]
+            try:
+                results = self._run_batch([item for item, _ in batch])
+            except Exception as e:
+                print(f"Error in {self.name} batch of {len(batch)}: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,268 @@
+"""Stage-level microbenchmarks for the /detect pipeline.
+
+Every stage runs on synthetic leaf-like images with randomly initialised models,
+so no checkpoints are needed. Results are written as JSON to diff between commits:
+
+    python benchmarks.py run --output before.json
+    python benchmarks.py run --output after.json
+    python benchmarks.py compare before.json after.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lazy_imports import LazyModule
+
+np = LazyModule("numpy")
+torch = LazyModule("torch")
+timm = LazyModule("timm")
+Image = LazyModule("PIL.Image")
+gradcam = LazyModule("gradcam")
+
+import db
+from overlay_store import encode_overlay, make_overlay
+from preprocess import decode_leaf_image, to_model_input
+
+RESOLUTIONS = ["640x480", "1920x1080", "4000x3000"]
+NUM_CLASSES = 10  # Tomato has the most classes
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def proc_status_mb(field):
+    """A memory field of /proc/self/status (e.g. VmRSS, VmHWM) in MB; None where unavailable"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Restart the kernel's RSS high-water mark (VmHWM), so it covers only what runs next (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def stage_memory(fn):
+    """Peak memory of one call to `fn()`, not counting what the process had reached before
+
+    On Linux the RSS high-water mark is reset first, so fixtures built earlier (e.g.
+    a 4000x3000 test image) do not count: peak_rss_mb is the highest RSS during the
+    call and rss_growth_mb how far it rose above the RSS at its start (memory the
+    allocator already holds is reused and not counted). Elsewhere only traced
+    Python/NumPy allocations are seen.
+    """
+    if reset_peak_rss():
+        before = proc_status_mb("VmRSS")
+        fn()
+        peak = proc_status_mb("VmHWM")
+        return {"peak_rss_mb": peak, "rss_growth_mb": peak - before}
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"traced_peak_mb": peak / (1024 * 1024)}
+
+
+def measure(fn, iterations, warmup=2, items=1):
+    """Time `fn()` and summarise latency, throughput (items/s) and the stage's own peak memory"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "items": items,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "mean_ms": total / iterations * 1000,
+        "throughput_per_s": iterations * items / total if total else None,
+        # On one extra, untimed call: tracing allocations would skew the timings
+        **stage_memory(fn),
+    }
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """JPEG bytes of a smooth green, leaf-coloured gradient with noise and blotches"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rgb = np.empty((height, width, 3), dtype=np.float32)
+    rgb[..., 0] = 60 + 40 * x / width
+    rgb[..., 1] = 140 + 60 * y / height
+    rgb[..., 2] = 50
+    for _ in range(8):
+        cx, cy, r = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(0.02, 0.08) * width
+        rgb[(x - cx) ** 2 + (y - cy) ** 2 < r * r] = (120, 90, 40)
+    rgb += rng.normal(0, 8, rgb.shape)
+    buffered = io.BytesIO()
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+
+def bench_preprocess(results, resolutions, iterations, size):
+    for resolution in resolutions:
+        width, height = (int(v) for v in resolution.split("x"))
+        data = synthetic_jpeg(width, height)
+        results[f"decode[{resolution}]"] = measure(
+            lambda: decode_leaf_image(io.BytesIO(data), size), iterations)
+    rgb = decode_leaf_image(io.BytesIO(synthetic_jpeg(640, 480)), size)
+    results["to_model_input"] = measure(lambda: to_model_input(rgb), iterations * 10)
+    return rgb
+
+
+def bench_model(results, rgb, batch_sizes, iterations, arch, device):
+    model = timm.create_model(arch, pretrained=False, num_classes=NUM_CLASSES).to(device).eval()
+    target_layer = gradcam.find_target_layer(model)
+    tensor = torch.as_tensor(to_model_input(rgb))
+    cam = None
+    for batch_size in batch_sizes:
+        batch = tensor.unsqueeze(0).repeat(batch_size, 1, 1, 1).to(device)
+
+        def forward():
+            with torch.no_grad():
+                torch.softmax(model(batch), dim=1).cpu()
+
+        results[f"forward[b={batch_size}]"] = measure(forward, iterations, items=batch_size)
+
+        def run_gradcam():
+            nonlocal cam
+            cam = gradcam.generate_gradcam(model, batch, target_layer)[2][0]
+
+        results[f"gradcam[b={batch_size}]"] = measure(run_gradcam, iterations, items=batch_size)
+    return cam
+
+
+def bench_overlay(results, rgb, cam, iterations):
+    overlay = make_overlay(rgb, cam, "Early Blight", "JET")
+    results["overlay"] = measure(lambda: make_overlay(rgb, cam, "Early Blight", "JET"), iterations * 10)
+    for fmt in ("webp", "jpeg", "png"):
+        results[f"encode[{fmt}]"] = measure(lambda: encode_overlay(overlay, fmt), iterations * 5)
+
+
+def bench_db(results, iterations):
+    with tempfile.TemporaryDirectory() as root:
+        pool = db.ConnectionPool(os.path.join(root, "bench.db"))
+        conn = pool.checkout()
+        db.init_db(conn)
+        user_id = db.create_user(conn, "bench", "bench@example.com", "x")
+        # Some history, so reads are not against an empty table
+        now = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        db.insert_predictions(conn, [(user_id, "Potato", "Early Blight", 90.0, now)] * 1000)
+
+        results["db_insert"] = measure(
+            lambda: db.insert_prediction(conn, user_id, "Potato", "Late Blight", 87.5), iterations * 10)
+        results["db_recent"] = measure(lambda: db.recent_predictions(conn, user_id), iterations * 10)
+        results["db_summary"] = measure(lambda: db.prediction_summary(conn, user_id), iterations * 10)
+        pool.checkin(conn)
+        pool.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    results = {}
+    rgb = bench_preprocess(results, args.resolutions, args.iterations, args.size)
+    cam = bench_model(results, rgb, args.batch_sizes, args.iterations, args.arch, args.device)
+    bench_overlay(results, rgb, cam, args.iterations)
+    bench_db(results, args.iterations)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "device": args.device,
+        "torch_threads": torch.get_num_threads(),
+        "arch": args.arch,
+        "stages": results,
+    }
+
+
+def compare(before, after, threshold):
+    """Print per-stage p50 changes; returns True if any stage slowed down past `threshold`"""
+    regressed = False
+    print(f"{'stage':<24}{'before p50':>12}{'after p50':>12}{'change':>10}")
+    for stage, new in after["stages"].items():
+        old = before["stages"].get(stage)
+        if old is None:
+            print(f"{stage:<24}{'-':>12}{new['p50_ms']:>11.2f}ms{'new':>10}")
+            continue
+        change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] if old["p50_ms"] else 0.0
+        flag = " !" if change > threshold else ""
+        regressed |= change > threshold
+        print(f"{stage:<24}{old['p50_ms']:>11.2f}ms{new['p50_ms']:>11.2f}ms{change:>+9.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline stage by stage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and write JSON results")
+    run_parser.add_argument("--output", help="JSON file to write (default: stdout)")
+    run_parser.add_argument("--iterations", type=int, default=20)
+    run_parser.add_argument("--resolutions", type=lambda v: v.split(","), default=RESOLUTIONS,
+                            help="Comma-separated WIDTHxHEIGHT list")
+    run_parser.add_argument("--batch-sizes", type=lambda v: [int(b) for b in v.split(",")], default=[1, 8])
+    run_parser.add_argument("--arch", default="tf_efficientnet_b0")
+    run_parser.add_argument("--size", type=int, default=224)
+    run_parser.add_argument("--device", default="cpu")
+    run_parser.add_argument("--threads", type=int, help="torch intra-op threads")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = json.dumps(run(args), indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(report + "\n")
+        else:
+            print(report)
+    else:
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        sys.exit(1 if compare(before, after, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
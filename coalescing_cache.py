@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class CoalescingCache:
+    """In-memory LRU+TTL cache with request coalescing
+
+    Concurrent lookups for the same key share one computation: the first caller
+    computes the value and the others wait for its result. Exceptions reach every
+    waiter and are not cached.
+    """
+
+    def __init__(self, max_entries=5000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, value), least recently used first
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def get(self, key):
+        """Cached value for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1]
+            self.counters["misses"] += 1
+            return None
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Cached value for `key`, calling `compute()` once on a miss"""
+        value, future, owner = self.claim(key)
+        if future is None:
+            return value
+        if not owner:
+            return future.result()
+        try:
+            value = compute()
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, value, ttl=ttl)
+        return value
+
+    def claim(self, key):
+        """(value, None, False) on a hit, else (None, future, owner)
+
+        The owner computes the value and must hand it to `finish`; everyone else
+        waits on the future for the owner's result.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1], None, False
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.counters["misses"] += 1
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        return None, future, owner
+
+    def finish(self, key, future, value=None, error=None, ttl=None):
+        """Complete a claimed computation: cache `value` and pass it to the waiters, or pass them `error`"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+                self.put(key, value, ttl)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["misses"] + counters["coalesced"]
+        hit_ratio = (counters["hits"] + counters["coalesced"]) / lookups if lookups else None
+        return {**counters, "entries": entries, "hit_ratio": hit_ratio}
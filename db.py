@@ -0,0 +1,425 @@
+import hashlib
+import queue
+import secrets
+import sqlite3
+from collections import namedtuple
+
+Prediction = namedtuple("Prediction", "created_at crop_type predicted_class confidence")
+User = namedtuple("User", "id username password_hash")
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",  # ~8 MB page cache per connection
+)
+
+
+class ConnectionPool:
+    """Reusable SQLite connections tuned for concurrent web traffic
+
+    Connections are opened lazily with WAL journaling, synchronous=NORMAL and a busy
+    timeout, and are handed out LIFO so hot connections keep their statement cache.
+    """
+
+    def __init__(self, path, max_idle=8, busy_timeout=5.0, cached_statements=128):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def checkin(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+
+# ----------------- SCHEMA MIGRATIONS -----------------
+# The schema version is tracked in PRAGMA user_version. Each migration runs in its
+# own transaction; append new ones, never edit applied ones.
+MIGRATIONS = [
+    (1, "base tables", [
+        # Users table
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )
+        """,
+        # Irrigation plans table
+        """
+        CREATE TABLE IF NOT EXISTS irrigation_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            crop_type TEXT,
+            field_size REAL,
+            soil_type TEXT,
+            growth_stage TEXT,
+            temperature REAL,
+            humidity REAL,
+            liters_per_day REAL,
+            times_per_week INTEGER,
+            minutes_per_session INTEGER,
+            best_time TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Predictions table
+        """
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            crop_type TEXT,
+            predicted_class TEXT,
+            confidence REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "per-user history indexes", [
+        # Covers the recent-predictions query so it never touches the table
+        """
+        CREATE INDEX IF NOT EXISTS idx_predictions_user_created
+        ON predictions (user_id, created_at DESC, crop_type, predicted_class, confidence)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_irrigation_plans_user_created
+        ON irrigation_plans (user_id, created_at DESC)
+        """,
+    ]),
+    (3, "per-user prediction statistics", [
+        # Counts per crop/class
+        """
+        CREATE TABLE IF NOT EXISTS prediction_stats (
+            user_id INTEGER NOT NULL,
+            crop_type TEXT NOT NULL,
+            predicted_class TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            last_seen TIMESTAMP,
+            PRIMARY KEY (user_id, crop_type, predicted_class)
+        ) WITHOUT ROWID
+        """,
+        # One row per user for the dashboard chart
+        """
+        CREATE TABLE IF NOT EXISTS user_prediction_summary (
+            user_id INTEGER PRIMARY KEY,
+            healthy INTEGER NOT NULL DEFAULT 0,
+            diseased INTEGER NOT NULL DEFAULT 0,
+            last_seen TIMESTAMP
+        )
+        """,
+        # Daily buckets for rolling-window counts, pruned past the window
+        """
+        CREATE TABLE IF NOT EXISTS prediction_daily_counts (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            healthy INTEGER NOT NULL DEFAULT 0,
+            diseased INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        """,
+        lambda conn: rebuild_prediction_stats(conn),
+    ]),
+    (4, "API tokens", [
+        # Only a hash of each token is stored
+        """
+        CREATE TABLE IF NOT EXISTS api_tokens (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=None):
+    """Apply pending migrations in order; returns the resulting schema version"""
+    for version, description, steps in migrations or MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        # IMMEDIATE takes the write lock up front so concurrent workers can't both apply it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied database migration {version}: {description}")
+    return schema_version(conn)
+
+
+def init_db(conn):
+    migrate(conn)
+    for problem in check_query_plans(conn):
+        print(f"Warning: {problem}")
+
+
+# ----------------- USERS -----------------
+INSERT_USER = "INSERT INTO users (username, email, password) VALUES (?, ?, ?)"
+SELECT_USER_BY_EMAIL = "SELECT id, username, password FROM users WHERE email=?"
+
+
+def create_user(conn, username, email, password_hash):
+    """Insert a user; raises sqlite3.IntegrityError if the email is taken"""
+    with conn:
+        return conn.execute(INSERT_USER, (username, email, password_hash)).lastrowid
+
+
+def find_user_by_email(conn, email):
+    row = conn.execute(SELECT_USER_BY_EMAIL, (email,)).fetchone()
+    return User(*row) if row else None
+
+
+# ----------------- API TOKENS -----------------
+INSERT_API_TOKEN = "INSERT INTO api_tokens (token_hash, user_id, name) VALUES (?, ?, ?)"
+SELECT_API_TOKEN_USER = "SELECT user_id FROM api_tokens WHERE token_hash=?"
+DELETE_API_TOKEN = "DELETE FROM api_tokens WHERE token_hash=?"
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_api_token(conn, user_id, name=None):
+    """Issue a bearer token for a user; the token itself is returned once and never stored"""
+    token = secrets.token_urlsafe(32)
+    with conn:
+        conn.execute(INSERT_API_TOKEN, (hash_token(token), user_id, name))
+    return token
+
+
+def user_id_for_token(conn, token):
+    row = conn.execute(SELECT_API_TOKEN_USER, (hash_token(token),)).fetchone()
+    return row[0] if row else None
+
+
+def revoke_api_token(conn, token):
+    with conn:
+        return conn.execute(DELETE_API_TOKEN, (hash_token(token),)).rowcount > 0
+
+
+# ----------------- PREDICTIONS -----------------
+INSERT_PREDICTION = """
+    INSERT INTO predictions (user_id, crop_type, predicted_class, confidence)
+    VALUES (?, ?, ?, ?)
+"""
+SELECT_RECENT_PREDICTIONS = """
+    SELECT created_at, crop_type, predicted_class, confidence
+    FROM predictions
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+
+INSERT_PREDICTION_AT = """
+    INSERT INTO predictions (user_id, crop_type, predicted_class, confidence, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def insert_prediction(conn, user_id, crop_type, predicted_class, confidence):
+    """Insert a prediction and update the user's statistics in the same transaction"""
+    with conn:
+        row_id = conn.execute(INSERT_PREDICTION, (user_id, crop_type, predicted_class, confidence)).lastrowid
+        record_prediction_stats(conn, user_id, crop_type, predicted_class)
+        return row_id
+
+
+def insert_predictions(conn, rows):
+    """Insert (user_id, crop_type, predicted_class, confidence, created_at) rows and their statistics in one transaction"""
+    with conn:
+        conn.executemany(INSERT_PREDICTION_AT, rows)
+        for user_id, crop_type, predicted_class, _, created_at in rows:
+            record_prediction_stats(conn, user_id, crop_type, predicted_class, created_at)
+
+
+def recent_predictions(conn, user_id, limit=5):
+    return [Prediction(*row) for row in conn.execute(SELECT_RECENT_PREDICTIONS, (user_id, limit))]
+
+
+# ----------------- PREDICTION STATISTICS -----------------
+STATS_WINDOW_DAYS = 30
+
+UPSERT_PREDICTION_STATS = """
+    INSERT INTO prediction_stats (user_id, crop_type, predicted_class, total, last_seen)
+    VALUES (?, ?, ?, 1, datetime(?))
+    ON CONFLICT (user_id, crop_type, predicted_class)
+    DO UPDATE SET total = total + 1, last_seen = max(COALESCE(last_seen, ''), excluded.last_seen)
+"""
+UPSERT_USER_SUMMARY = """
+    INSERT INTO user_prediction_summary (user_id, healthy, diseased, last_seen)
+    VALUES (?, ?, ?, datetime(?))
+    ON CONFLICT (user_id)
+    DO UPDATE SET healthy = healthy + excluded.healthy,
+                  diseased = diseased + excluded.diseased,
+                  last_seen = max(COALESCE(last_seen, ''), excluded.last_seen)
+"""
+UPSERT_DAILY_COUNTS = """
+    INSERT INTO prediction_daily_counts (user_id, day, healthy, diseased)
+    VALUES (?, date(?), ?, ?)
+    ON CONFLICT (user_id, day)
+    DO UPDATE SET healthy = healthy + excluded.healthy, diseased = diseased + excluded.diseased
+"""
+PRUNE_DAILY_COUNTS = f"""
+    DELETE FROM prediction_daily_counts
+    WHERE user_id = ? AND day <= date('now', '-{STATS_WINDOW_DAYS} days')
+"""
+SELECT_USER_SUMMARY = "SELECT healthy, diseased, last_seen FROM user_prediction_summary WHERE user_id = ?"
+SELECT_WINDOW_COUNTS = f"""
+    SELECT COALESCE(SUM(healthy), 0), COALESCE(SUM(diseased), 0)
+    FROM prediction_daily_counts
+    WHERE user_id = ? AND day > date('now', '-{STATS_WINDOW_DAYS} days')
+"""
+SELECT_CLASS_STATS = """
+    SELECT crop_type, predicted_class, total, last_seen
+    FROM prediction_stats
+    WHERE user_id = ?
+    ORDER BY total DESC
+"""
+
+PredictionSummary = namedtuple("PredictionSummary", "healthy diseased last_seen recent_healthy recent_diseased")
+ClassStats = namedtuple("ClassStats", "crop_type predicted_class total last_seen")
+
+
+def is_healthy(predicted_class):
+    return 'healthy' in predicted_class.lower()
+
+
+def record_prediction_stats(conn, user_id, crop_type, predicted_class, created_at="now"):
+    """Increment the summary tables for one new prediction; call inside the insert's transaction"""
+    healthy = 1 if is_healthy(predicted_class) else 0
+    conn.execute(UPSERT_PREDICTION_STATS, (user_id, crop_type, predicted_class, created_at))
+    conn.execute(UPSERT_USER_SUMMARY, (user_id, healthy, 1 - healthy, created_at))
+    conn.execute(UPSERT_DAILY_COUNTS, (user_id, created_at, healthy, 1 - healthy))
+    conn.execute(PRUNE_DAILY_COUNTS, (user_id,))
+
+
+def prediction_summary(conn, user_id):
+    """All-time and rolling-window healthy/diseased counts from the summary tables"""
+    row = conn.execute(SELECT_USER_SUMMARY, (user_id,)).fetchone() or (0, 0, None)
+    recent = conn.execute(SELECT_WINDOW_COUNTS, (user_id,)).fetchone()
+    return PredictionSummary(row[0], row[1], row[2], recent[0], recent[1])
+
+
+def class_stats(conn, user_id):
+    return [ClassStats(*row) for row in conn.execute(SELECT_CLASS_STATS, (user_id,))]
+
+
+def rebuild_prediction_stats(conn, user_id=None):
+    """Recompute the summary tables from the raw predictions, for all users or one"""
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    healthy = "lower(predicted_class) LIKE '%healthy%'"
+    for table in ("prediction_stats", "user_prediction_summary", "prediction_daily_counts"):
+        conn.execute(f"DELETE FROM {table} {where}", params)
+    conn.execute(f"""
+        INSERT INTO prediction_stats (user_id, crop_type, predicted_class, total, last_seen)
+        SELECT user_id, crop_type, predicted_class, COUNT(*), MAX(created_at)
+        FROM predictions {where}
+        GROUP BY user_id, crop_type, predicted_class
+    """, params)
+    conn.execute(f"""
+        INSERT INTO user_prediction_summary (user_id, healthy, diseased, last_seen)
+        SELECT user_id, SUM({healthy}), SUM(NOT {healthy}), MAX(created_at)
+        FROM predictions {where}
+        GROUP BY user_id
+    """, params)
+    window = f"date(created_at) > date('now', '-{STATS_WINDOW_DAYS} days')"
+    conn.execute(f"""
+        INSERT INTO prediction_daily_counts (user_id, day, healthy, diseased)
+        SELECT user_id, date(created_at), SUM({healthy}), SUM(NOT {healthy})
+        FROM predictions
+        WHERE {window} {"AND user_id = ?" if user_id is not None else ""}
+        GROUP BY user_id, date(created_at)
+    """, params)
+
+
+# ----------------- IRRIGATION PLANS -----------------
+INSERT_IRRIGATION_PLAN = """
+    INSERT INTO irrigation_plans (user_id, crop_type, field_size, soil_type, growth_stage, temperature, humidity, liters_per_day, times_per_week, minutes_per_session, best_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def insert_irrigation_plan(conn, user_id, crop_type, field_size, soil_type, growth_stage,
+                           temperature, humidity, liters_per_day, times_per_week,
+                           minutes_per_session, best_time):
+    with conn:
+        return conn.execute(INSERT_IRRIGATION_PLAN, (
+            user_id, crop_type, field_size, soil_type, growth_stage, temperature, humidity,
+            liters_per_day, times_per_week, minutes_per_session, best_time,
+        )).lastrowid
+
+
+def insert_irrigation_plans(conn, user_id, plans):
+    """Insert many plans (tuples in INSERT_IRRIGATION_PLAN column order, without user_id) in one transaction"""
+    with conn:
+        conn.executemany(INSERT_IRRIGATION_PLAN, ((user_id,) + tuple(plan) for plan in plans))
+
+
+# ----------------- QUERY PLANS -----------------
+# Hot queries and the index each one must be served from
+HOT_QUERIES = [
+    (SELECT_RECENT_PREDICTIONS, (0, 5), "idx_predictions_user_created"),
+]
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn):
+    """Problems with hot query plans: missing index use or an extra sort step"""
+    problems = []
+    for sql, params, index in HOT_QUERIES:
+        plan = explain(conn, sql, params)
+        if not any(index in step for step in plan):
+            problems.append(f"query does not use {index}: {plan}")
+        if any("TEMP B-TREE" in step for step in plan):
+            problems.append(f"query sorts in a temp b-tree: {plan}")
+    return problems
@@ -0,0 +1,63 @@
+import weakref
+
+import torch
+import torch.nn.functional as F
+
+
+def find_target_layer(model, layer_name=None):
+    """Named module, or the last convolutional layer of the model, used as the Grad-CAM target"""
+    if layer_name:
+        return dict(model.named_modules()).get(layer_name)
+    for name, module in reversed(list(model.named_modules())):
+        if isinstance(module, torch.nn.Conv2d):
+            return module
+    return None
+
+
+class GradCAMHooks:
+    """Forward/backward hooks registered once on a model's Grad-CAM target layer"""
+
+    def __init__(self, target_layer):
+        self.activations = None
+        self.gradients = None
+        target_layer.register_forward_hook(self._save_activations)
+        target_layer.register_full_backward_hook(self._save_gradients)
+
+    def _save_activations(self, module, input, output):
+        if torch.is_grad_enabled():
+            self.activations = output.detach()
+
+    def _save_gradients(self, module, grad_in, grad_out):
+        self.gradients = grad_out[0].detach()
+
+
+# Keyed weakly so models replaced by a hot reload can be freed
+gradcam_hooks = weakref.WeakKeyDictionary()
+
+
+def generate_gradcam(model, input_tensor, target_layer, target_class=None):
+    """Single forward+backward pass over a batch returning (logits, probabilities, cams, target classes)"""
+    hooks = gradcam_hooks.get(model)
+    if hooks is None:
+        hooks = gradcam_hooks[model] = GradCAMHooks(target_layer)
+    model.eval()
+
+    with torch.enable_grad():
+        logits = model(input_tensor)
+        if target_class is None:
+            target_class = logits.argmax(dim=1)
+        else:
+            target_class = torch.as_tensor(target_class, device=logits.device).reshape(-1).expand(logits.shape[0])
+        model.zero_grad(set_to_none=True)
+        logits.gather(1, target_class.view(-1, 1)).sum().backward()
+
+    logits = logits.detach()
+    probabilities = torch.softmax(logits, dim=1)
+
+    weights = hooks.gradients.mean(dim=(2, 3))  # Global Average Pooling -> [B, C]
+    cams = F.relu(torch.einsum("bc,bchw->bhw", weights, hooks.activations))
+    cam_min = cams.amin(dim=(1, 2), keepdim=True)
+    cam_max = cams.amax(dim=(1, 2), keepdim=True)
+    cams = ((cams - cam_min) / (cam_max - cam_min + 1e-8)).cpu().numpy()  # Normalize 0-1
+
+    return logits, probabilities, cams, target_class
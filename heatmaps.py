@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lazy_imports import LazyModule
+
+np = LazyModule("numpy")
+
+
+class HeatmapStore:
+    """Deferred Grad-CAM overlays
+
+    Detection parks each request's inputs here and returns an ID immediately. The
+    overlay is rendered on a background worker the first time it is asked for, and
+    the result is kept until the entry expires.
+
+    With `root`, parked jobs and finished overlay names are also written to that
+    directory, so a worker process sharing it can serve a heatmap parked by another.
+    """
+
+    def __init__(self, render, max_workers=2, ttl=600, max_entries=1000, root=None, sweep_every=64):
+        self._render = render
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.root = root
+        self.sweep_every = sweep_every
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="heatmap")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._adds = 0
+        if root:
+            os.makedirs(root, exist_ok=True)
+
+    def add(self, job, owner=None):
+        """Park a render job and return its heatmap ID"""
+        heatmap_id = uuid.uuid4().hex
+        if self.root:
+            self._write_job(heatmap_id, job, owner)
+        with self._lock:
+            self._prune(time.monotonic())
+            self._entries[heatmap_id] = {
+                "job": job,
+                "owner": owner,
+                "future": None,
+                "expires": time.monotonic() + self.ttl,
+            }
+            self._adds += 1
+            sweep = self.root and self._adds % self.sweep_every == 0
+        if sweep:
+            self._sweep()
+        return heatmap_id
+
+    def request(self, heatmap_id, owner=None):
+        """Future for the rendered overlay, starting the render if needed; None if unknown/expired"""
+        with self._lock:
+            self._prune(time.monotonic())
+            entry = self._entries.get(heatmap_id)
+            if entry is not None:
+                if entry["owner"] != owner:
+                    return None
+                if entry["future"] is None:
+                    entry["future"] = self._submit(heatmap_id, entry.pop("job"))
+                return entry["future"]
+        if not self.root:
+            return None
+        return self._request_shared(heatmap_id, owner)
+
+    def _submit(self, heatmap_id, job):
+        future = self._executor.submit(self._render, job)
+        if self.root:
+            future.add_done_callback(lambda f: self._write_result(heatmap_id, f))
+        return future
+
+    def _request_shared(self, heatmap_id, owner):
+        # Parked by another worker process
+        if len(heatmap_id) != 32 or not all(c in "0123456789abcdef" for c in heatmap_id):
+            return None
+        parked = self._read_job(heatmap_id)
+        if parked is None:
+            return None
+        job, job_owner, expires = parked
+        remaining = expires - time.time()
+        if job_owner != owner or remaining <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(heatmap_id)
+            if entry is None:
+                name = self._read_result(heatmap_id)
+                if name is not None:
+                    future = Future()
+                    future.set_result(name)
+                else:
+                    future = self._submit(heatmap_id, job)
+                entry = self._entries[heatmap_id] = {
+                    "owner": job_owner,
+                    "future": future,
+                    "expires": time.monotonic() + remaining,
+                }
+            return entry["future"]
+
+    def _path(self, heatmap_id, ext):
+        return os.path.join(self.root, f"{heatmap_id}.{ext}")
+
+    def _write_atomically(self, path, write):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing heatmap file: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _write_job(self, heatmap_id, job, owner):
+        arrays = {key: value for key, value in job.items() if hasattr(value, "dtype")}
+        meta = {
+            "job": {key: value for key, value in job.items() if key not in arrays},
+            "owner": owner,
+            "expires": time.time() + self.ttl,
+        }
+        self._write_atomically(self._path(heatmap_id, "npz"),
+                               lambda f: np.savez(f, meta=np.array(json.dumps(meta)), **arrays))
+
+    def _read_job(self, heatmap_id):
+        try:
+            with np.load(self._path(heatmap_id, "npz")) as data:
+                meta = json.loads(str(data["meta"]))
+                job = {**meta["job"], **{key: data[key] for key in data.files if key != "meta"}}
+        except (OSError, ValueError, KeyError):
+            return None
+        return job, meta["owner"], meta["expires"]
+
+    def _write_result(self, heatmap_id, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._write_atomically(self._path(heatmap_id, "done"), lambda f: f.write(future.result().encode()))
+
+    def _read_result(self, heatmap_id):
+        try:
+            with open(self._path(heatmap_id, "done")) as f:
+                return f.read() or None
+        except OSError:
+            return None
+
+    def _sweep(self):
+        cutoff = time.time() - self.ttl
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _prune(self, now):
+        # Entries are kept in insertion order, which is also expiry order (jobs picked up
+        # from `root` may expire earlier and then linger until max_entries evicts them)
+        while self._entries and next(iter(self._entries.values()))["expires"] <= now:
+            self._entries.popitem(last=False)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
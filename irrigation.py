@@ -0,0 +1,200 @@
+"""Irrigation planning rules, for one field or thousands at once.
+
+`plan_irrigation` is the reference single-field path; `plan_irrigation_bulk`
+applies the same rules and rounding to whole columns with NumPy. test_irrigation.py
+checks that the two agree on random fields, including unknown categories and
+threshold values; the same check runs on more fields from the command line:
+
+    python irrigation.py parity --fields 100000
+    python irrigation.py plan fields.csv > plans.csv
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import random
+import sys
+
+from lazy_imports import LazyModule
+
+np = LazyModule("numpy")
+
+# Litres per day per unit of field size, before adjustments
+CROP_WATER_NEEDS = {'tomato': 600, 'potato': 500, 'wheat': 450, 'rice': 1200, 'maize': 550, 'cotton': 700}
+SOIL_FACTOR = {'clay': 0.8, 'sandy': 1.2, 'loamy': 1.0, 'silt': 0.9}
+GROWTH_FACTOR = {'seedling': 0.6, 'vegetative': 0.8, 'flowering': 1.0, 'fruiting': 0.9}
+DEFAULT_WATER_NEED = 500
+HOT_TEMPERATURE = 30  # Above this the daily need goes up by 20%
+WARM_TEMPERATURE = 25  # Above this: water more often, in the evening
+DRY_HUMIDITY = 50  # Below this the daily need goes up by 10%
+EVENING = 'Evening (6-8 PM)'
+MORNING = 'Morning (5-8 AM)'
+
+FIELD_COLUMNS = ["crop_type", "field_size", "soil_type", "growth_stage", "temperature", "humidity"]
+NUMERIC_COLUMNS = ["field_size", "temperature", "humidity"]
+PLAN_COLUMNS = ["liters_per_day", "times_per_week", "minutes_per_session", "best_time"]
+
+
+class FieldsRejected(ValueError):
+    """Bulk input that cannot be planned, with the offending field number"""
+
+
+def plan_irrigation(crop_type, field_size, soil_type, growth_stage, temperature, humidity):
+    water_need = CROP_WATER_NEEDS.get(crop_type, DEFAULT_WATER_NEED) * field_size * \
+                 SOIL_FACTOR.get(soil_type, 1.0) * GROWTH_FACTOR.get(growth_stage, 1.0)
+    if temperature > HOT_TEMPERATURE:
+        water_need *= 1.2
+    if humidity < DRY_HUMIDITY:
+        water_need *= 1.1
+
+    times_per_week = 4 if temperature > WARM_TEMPERATURE else 3
+    return {
+        'liters_per_day': round(water_need),
+        'times_per_week': times_per_week,
+        'minutes_per_session': round(water_need / (times_per_week * 10)),
+        'best_time': EVENING if temperature > WARM_TEMPERATURE else MORNING,
+    }
+
+
+def _lookup(values, table, default):
+    # One dict lookup per distinct value, then a gather
+    keys, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    factors = np.array([table.get(key, default) for key in keys], dtype=np.float64)
+    return factors[inverse.reshape(-1)]
+
+
+def plan_irrigation_bulk(fields):
+    """Plans for a list of field dicts in one vectorized pass; returns a dict of PLAN_COLUMNS arrays"""
+    if not fields:
+        return {column: np.array([]) for column in PLAN_COLUMNS}
+    field_size = np.array([f["field_size"] for f in fields], dtype=np.float64)
+    temperature = np.array([f["temperature"] for f in fields], dtype=np.float64)
+    humidity = np.array([f["humidity"] for f in fields], dtype=np.float64)
+
+    # Same operation order as plan_irrigation, so results are bit-identical
+    water_need = _lookup([f["crop_type"] for f in fields], CROP_WATER_NEEDS, DEFAULT_WATER_NEED) * field_size \
+        * _lookup([f["soil_type"] for f in fields], SOIL_FACTOR, 1.0) \
+        * _lookup([f["growth_stage"] for f in fields], GROWTH_FACTOR, 1.0)
+    water_need = np.where(temperature > HOT_TEMPERATURE, water_need * 1.2, water_need)
+    water_need = np.where(humidity < DRY_HUMIDITY, water_need * 1.1, water_need)
+
+    warm = temperature > WARM_TEMPERATURE
+    times_per_week = np.where(warm, 4, 3)
+    # np.rint rounds half to even, like round()
+    return {
+        'liters_per_day': np.rint(water_need).astype(np.int64),
+        'times_per_week': times_per_week,
+        'minutes_per_session': np.rint(water_need / (times_per_week * 10)).astype(np.int64),
+        'best_time': np.where(warm, EVENING, MORNING),
+    }
+
+
+def read_fields(text, fmt="csv", max_fields=50000):
+    """Parse a CSV or a JSON array of fields; column names may use '-' or '_'"""
+    if fmt == "json":
+        try:
+            records = json.loads(text)
+        except ValueError:
+            raise FieldsRejected("Fields are not valid JSON.")
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise FieldsRejected("JSON fields must be an array of objects.")
+    else:
+        records = csv.DictReader(io.StringIO(text))
+
+    fields = []
+    for number, record in enumerate(records, 1):
+        if number > max_fields:
+            raise FieldsRejected(f"At most {max_fields} fields can be planned at once.")
+        record = {str(key).strip().lower().replace("-", "_"): value for key, value in record.items() if key}
+        missing = [column for column in FIELD_COLUMNS if record.get(column) in (None, "")]
+        if missing:
+            raise FieldsRejected(f"Field {number}: missing {', '.join(missing)}.")
+        try:
+            for column in NUMERIC_COLUMNS:
+                record[column] = float(record[column])
+        except (TypeError, ValueError):
+            raise FieldsRejected(f"Field {number}: field size, temperature and humidity must be numbers.")
+        if not all(math.isfinite(record[column]) for column in NUMERIC_COLUMNS):
+            raise FieldsRejected(f"Field {number}: field size, temperature and humidity must be finite numbers.")
+        for column in ("crop_type", "soil_type", "growth_stage"):
+            record[column] = str(record[column])
+        fields.append(record)
+    return fields
+
+
+def plan_rows(fields, plans):
+    """(field, plan) dicts per field, with plain Python values"""
+    columns = {column: plans[column].tolist() for column in PLAN_COLUMNS}
+    for i, field in enumerate(fields):
+        yield field, {column: columns[column][i] for column in PLAN_COLUMNS}
+
+
+def iter_csv(fields, plans, chunk_rows=500):
+    """CSV text chunks: the input columns (plus field_id if given) followed by the plan"""
+    header = (["field_id"] if fields and "field_id" in fields[0] else []) + FIELD_COLUMNS + PLAN_COLUMNS
+    buffered = io.StringIO()
+    writer = csv.DictWriter(buffered, fieldnames=header, extrasaction="ignore")
+    writer.writeheader()
+    for i, (field, plan) in enumerate(plan_rows(fields, plans), 1):
+        writer.writerow({**field, **plan})
+        if i % chunk_rows == 0:
+            yield buffered.getvalue()
+            buffered.seek(0)
+            buffered.truncate()
+    yield buffered.getvalue()
+
+
+def random_fields(count, seed=0):
+    """Random fields covering every category, unknown values and the threshold temperatures/humidity"""
+    rng = random.Random(seed)
+    crops = list(CROP_WATER_NEEDS) + ["sugarcane"]
+    soils = list(SOIL_FACTOR) + ["peat"]
+    stages = list(GROWTH_FACTOR) + ["dormant"]
+    return [{
+        "crop_type": rng.choice(crops),
+        "field_size": rng.choice([rng.uniform(0.01, 500), round(rng.uniform(0, 50), 1)]),
+        "soil_type": rng.choice(soils),
+        "growth_stage": rng.choice(stages),
+        "temperature": rng.choice([rng.uniform(-5, 48), WARM_TEMPERATURE, HOT_TEMPERATURE, float(rng.randint(0, 45))]),
+        "humidity": rng.choice([rng.uniform(0, 100), DRY_HUMIDITY, float(rng.randint(0, 100))]),
+    } for _ in range(count)]
+
+
+def parity_check(fields):
+    """Fields where the bulk path disagrees with plan_irrigation: [(index, single, bulk), ...]"""
+    mismatches = []
+    plans = plan_irrigation_bulk(fields)
+    for i, (field, bulk) in enumerate(plan_rows(fields, plans)):
+        single = plan_irrigation(*(field[column] for column in FIELD_COLUMNS))
+        if single != bulk:
+            mismatches.append((i, single, bulk))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Irrigation planning from the command line")
+    parser.add_argument("command", choices=["parity", "plan"])
+    parser.add_argument("path", nargs="?", help="CSV or JSON fields file for 'plan'")
+    parser.add_argument("--fields", type=int, default=10000, help="Random fields for 'parity'")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "parity":
+        fields = random_fields(args.fields, args.seed)
+        mismatches = parity_check(fields)
+        for i, single, bulk in mismatches[:10]:
+            print(f"field {i} {fields[i]}: single {single} != bulk {bulk}")
+        print(f"{len(fields) - len(mismatches)}/{len(fields)} plans match")
+        sys.exit(1 if mismatches else 0)
+
+    if not args.path:
+        parser.error("plan needs a fields file")
+    with open(args.path) as f:
+        fields = read_fields(f.read(), "json" if args.path.endswith(".json") else "csv")
+    for chunk in iter_csv(fields, plan_irrigation_bulk(fields)):
+        sys.stdout.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
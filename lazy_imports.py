@@ -0,0 +1,65 @@
+import importlib
+import threading
+import time
+
+PROCESS_STARTED = time.perf_counter()
+
+# Module name -> {"seconds": import time, "at": seconds since process start, "deferred": bool}
+IMPORT_TIMINGS = {}
+_boot_seconds = None
+_lock = threading.Lock()
+
+
+def timed_import(name):
+    """Import a module and record how long it took"""
+    with _lock:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        if name not in IMPORT_TIMINGS:
+            IMPORT_TIMINGS[name] = {
+                "seconds": time.perf_counter() - started,
+                "at": started - PROCESS_STARTED,
+                "deferred": _boot_seconds is not None,
+            }
+    return module
+
+
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = timed_import(self._name)
+        return getattr(module, attr)
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+
+def mark_booted():
+    """Record the end of application startup; later imports count as deferred"""
+    global _boot_seconds
+    _boot_seconds = time.perf_counter() - PROCESS_STARTED
+
+
+def startup_report():
+    """Boot time and per-import timings, slowest first"""
+    imports = sorted(IMPORT_TIMINGS.items(), key=lambda item: item[1]["seconds"], reverse=True)
+    return {
+        "boot_seconds": _boot_seconds,
+        "imports": [{"module": name, **timing} for name, timing in imports],
+    }
+
+
+def print_startup_report():
+    report = startup_report()
+    print(f"Startup finished in {report['boot_seconds'] or 0:.3f}s")
+    for entry in report["imports"]:
+        when = "deferred" if entry["deferred"] else "startup"
+        print(f"  {entry['module']:<24} {entry['seconds'] * 1000:8.1f} ms  ({when})")
@@ -0,0 +1,183 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Recording is a dict update and a bisect under one lock, cheap enough for the
+request hot path. Gauges are computed by collector callbacks when /metrics is
+scraped. With several worker processes each one dumps its counters and
+histograms to a shared directory, and a scrape merges them.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; from a cache hit up to a slow upstream call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help = {}  # name -> (type, help)
+        self._counters = {}  # (name, label key) -> value
+        self._histograms = {}  # (name, label key) -> [per-bucket counts..., +Inf count, sum]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def timer(self, name, errors=None, **labels):
+        """Observe the duration of the block into histogram `name`, counting exceptions in counter `errors`"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors:
+                self.inc(errors, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def collector(self, fn):
+        """Register `fn() -> [(name, kind, help, [(labels, value), ...]), ...]`, called on each scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, list(key), value] for (name, key), value in self._counters.items()],
+                "histograms": [[name, list(key), list(series)] for (name, key), series in self._histograms.items()],
+            }
+
+    def dump(self, directory):
+        """Write this process's counters and histograms for other processes' scrapes to merge"""
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def start_dumping(self, directory, interval=5.0):
+        """Dump this process's metrics to `directory` every `interval` seconds"""
+        os.makedirs(directory, exist_ok=True)
+
+        def loop():
+            while True:
+                try:
+                    self.dump(directory)
+                except OSError as e:
+                    print(f"Error writing metrics: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+    def render(self, directory=None):
+        """Prometheus text format; merges the other live processes' dumps in `directory`"""
+        counters, histograms = {}, {}
+        snapshots = [self.snapshot()]
+        if directory:
+            snapshots += self._other_snapshots(directory)
+        for snapshot in snapshots:
+            for name, key, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, key)))
+                counters[key] = counters.get(key, 0) + value
+            for name, key, series in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, key)))
+                merged = histograms.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    merged[i] += value
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines += self._header(name, "counter")
+            for (series_name, key), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines += self._header(name, "histogram")
+            for (series_name, key), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {series[-1]}")
+                lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name, default_kind):
+        kind, help_text = self._help.get(name, (default_kind, name))
+        return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+    @staticmethod
+    def _other_snapshots(directory):
+        snapshots = []
+        for filename in os.listdir(directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                # Exited worker; its counts go with it, as for a restarted process
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import threading
+import time
+
+from batching import MicroBatcher
+from lazy_imports import LazyModule
+
+# The vision stack is only imported once a crop model is actually loaded
+torch = LazyModule("torch")
+timm = LazyModule("timm")
+gradcam = LazyModule("gradcam")
+onnx_backend = LazyModule("onnx_backend")
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class CropSpec:
+    """Everything needed to serve disease detection for one crop"""
+
+    def __init__(self, name, checkpoint_path, class_names, arch="tf_efficientnet_b0",
+                 colormaps=None, target_layer=None, input_size=224):
+        self.name = name
+        self.checkpoint_path = checkpoint_path
+        self.class_names = list(class_names)
+        self.arch = arch
+        # Class name -> OpenCV colormap name (e.g. "JET"), None for no heatmap
+        self.colormaps = dict(colormaps or {})
+        # Module name of the Grad-CAM layer, None for the last Conv2d
+        self.target_layer = target_layer
+        self.input_size = input_size
+
+    def colormap(self, class_name, default="JET"):
+        return self.colormaps.get(class_name, default)
+
+
+class LoadedCrop:
+    """A loaded model together with its cached Grad-CAM layer and batching workers
+
+    `batcher` runs the fused torch Grad-CAM pass (`detect`) on (input, class index) items and
+    yields (probabilities, cam), the cam explaining the given class;
+    `classifier` runs plain classification (`classify`) on the configured backend.
+    """
+
+    def __init__(self, spec, model, target_layer, detect, classify, backend, version, mtime,
+                 onnx_path=None):
+        self.spec = spec
+        self.model = model
+        self.target_layer = target_layer
+        self.detect = detect
+        self.classify = classify
+        self.backend = backend
+        self.version = version
+        self.mtime = mtime
+        self.onnx_path = onnx_path
+        self.batcher = None
+        self.classifier = None
+
+    def start_workers(self, max_batch_size, max_wait_ms):
+        """(Re)start the batching threads, e.g. in a forked worker where they no longer exist"""
+        name = f"{self.spec.name.lower()}-{self.version}"
+        self.batcher = MicroBatcher(f"{name}-gradcam", self.detect,
+                                    max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.classifier = MicroBatcher(f"{name}-{self.backend}", self.classify,
+                                       max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def close(self):
+        self.batcher.close()
+        self.classifier.close()
+
+
+def build_torch_model(spec, checkpoint_path, device):
+    model = timm.create_model(spec.arch, pretrained=False, num_classes=len(spec.class_names))
+    state_dict = torch.load(checkpoint_path, map_location=device)
+    model.load_state_dict(state_dict)
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def checkpoint_version(path):
+    """Short content hash of a checkpoint, used as the model version"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """Lazily loads crop models on first use and hot-swaps them when their checkpoint changes"""
+
+    def __init__(self, device=None, batch_max_size=8, batch_max_wait_ms=10, warmup_runs=1,
+                 reload_check_interval=30, backend="torch"):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown inference backend {backend!r}, choose from {BACKENDS}")
+        self.device = device
+        self.backend = backend
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.warmup_runs = warmup_runs
+        self.reload_check_interval = reload_check_interval
+        self._specs = {}
+        self._loaded = {}
+        self._failed = {}
+        self._last_checked = {}
+        self._locks = {}
+
+    def register(self, spec):
+        self._specs[spec.name] = spec
+        self._locks[spec.name] = threading.Lock()
+
+    def crops(self):
+        return list(self._specs)
+
+    def spec(self, name):
+        return self._specs.get(name)
+
+    def get(self, name):
+        """Loaded crop for `name`, loading it on first use; None if unavailable"""
+        if name not in self._specs:
+            return None
+        crop = self._loaded.get(name)
+        if crop is not None:
+            self._maybe_reload(name, crop)
+            return self._loaded.get(name)
+        if name in self._failed:
+            return None
+        with self._locks[name]:
+            if name not in self._loaded and name not in self._failed:
+                self._install(name, self._specs[name].checkpoint_path)
+        return self._loaded.get(name)
+
+    def preload(self, names):
+        """Load and warm up the given crops in a background thread"""
+        names = [name for name in names if name in self._specs]
+        if names:
+            threading.Thread(target=lambda: [self.get(name) for name in names],
+                             name="model-preload", daemon=True).start()
+
+    def reload(self, name, checkpoint_path=None):
+        """Load a (new) checkpoint and swap it in; requests keep using the old model until the swap"""
+        spec = self._specs[name]
+        if checkpoint_path:
+            spec.checkpoint_path = checkpoint_path
+        with self._locks[name]:
+            self._failed.pop(name, None)
+            return self._install(name, spec.checkpoint_path)
+
+    def after_fork(self):
+        """Re-create per-process state in a forked worker
+
+        Weights are inherited copy-on-write from the parent, but its threads are not,
+        and ONNX Runtime sessions own thread pools of their own.
+        """
+        self._locks = {name: threading.Lock() for name in self._specs}
+        for crop in self._loaded.values():
+            if crop.onnx_path:
+                crop.classify = onnx_backend.make_batch_classifier(onnx_backend.create_session(crop.onnx_path))
+            crop.start_workers(self.batch_max_size, self.batch_max_wait_ms)
+
+    def status(self):
+        """Per-crop load state, e.g. for health checks"""
+        state = {}
+        for name in self._specs:
+            crop = self._loaded.get(name)
+            if crop is not None:
+                state[name] = {"loaded": True, "version": crop.version, "backend": crop.backend}
+            else:
+                state[name] = {"loaded": False, "error": self._failed.get(name)}
+        return state
+
+    def _maybe_reload(self, name, crop):
+        if not self.reload_check_interval:
+            return
+        now = time.monotonic()
+        if now - self._last_checked.get(name, 0) < self.reload_check_interval:
+            return
+        self._last_checked[name] = now
+        try:
+            mtime = os.stat(crop.spec.checkpoint_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != crop.mtime and self._locks[name].acquire(blocking=False):
+            try:
+                print(f"{name} checkpoint changed, reloading model...")
+                self._install(name, crop.spec.checkpoint_path)
+            finally:
+                self._locks[name].release()
+
+    def _install(self, name, checkpoint_path):
+        spec = self._specs[name]
+        try:
+            crop = self._load(spec, checkpoint_path)
+        except Exception as e:
+            print(f"Warning: Could not load {name.lower()} disease detection model: {e}")
+            if name not in self._loaded:
+                self._failed[name] = str(e)
+                print(f"{name} disease detection features will be disabled.")
+            return None
+
+        old = self._loaded.get(name)
+        self._loaded[name] = crop
+        self._last_checked[name] = time.monotonic()
+        if old is not None:
+            # Requests already queued on the old worker are served before it exits; requests
+            # still holding the old crop get BatcherClosed and retry on the new one
+            old.close()
+        print(f"{name} disease detection model loaded successfully! (version {crop.version}, {crop.backend})")
+        return crop
+
+    def _resolve_device(self):
+        if self.device is None:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        return torch.device(self.device)
+
+    def _load(self, spec, checkpoint_path):
+        device = self._resolve_device()
+        mtime = os.stat(checkpoint_path).st_mtime_ns
+        version = checkpoint_version(checkpoint_path)
+        model = build_torch_model(spec, checkpoint_path, device)
+
+        # Export/quantize before the Grad-CAM hooks are attached to the model
+        backend = self.backend
+        classify = self._make_batch_classifier(model, device)
+        path = None
+        if backend != "torch":
+            try:
+                path = onnx_backend.ensure_onnx(model, checkpoint_path, spec.input_size, int8=backend == "onnx-int8")
+                classify = onnx_backend.make_batch_classifier(onnx_backend.create_session(path))
+            except Exception as e:
+                print(f"Warning: {backend} backend unavailable for {spec.name}, using torch: {e}")
+                backend = "torch"
+                path = None
+
+        target_layer = gradcam.find_target_layer(model, spec.target_layer)
+        if target_layer is None:
+            raise ValueError(f"no Grad-CAM target layer found in {spec.arch}")
+
+        # Warm up so the first user request does not pay for lazy kernel initialisation
+        warmup = torch.zeros(1, 3, spec.input_size, spec.input_size, device=device)
+        for _ in range(self.warmup_runs):
+            gradcam.generate_gradcam(model, warmup, target_layer)
+            classify([warmup[0].cpu()])
+
+        detect = self._make_batch_detector(model, target_layer, device)
+        crop = LoadedCrop(spec, model, target_layer, detect, classify, backend, version, mtime, path)
+        crop.start_workers(self.batch_max_size, self.batch_max_wait_ms)
+        return crop
+
+    def _make_batch_classifier(self, model, device):
+        """Batch function mapping preprocessed image tensors to softmax rows"""
+        def run_batch(tensors):
+            batch = torch.stack([torch.as_tensor(t) for t in tensors]).to(device)
+            with torch.no_grad():
+                return list(torch.softmax(model(batch), dim=1).cpu().numpy())
+        return run_batch
+
+    def _make_batch_detector(self, model, target_layer, device):
+        """Batch function mapping (preprocessed image tensor, class index) items to (probabilities, cam) pairs"""
+        def run_batch(items):
+            batch = torch.stack([torch.as_tensor(t) for t, _ in items]).to(device)
+            target_classes = [target_class for _, target_class in items]
+            _, probabilities, cams, _ = gradcam.generate_gradcam(model, batch, target_layer, target_classes)
+            return list(zip(probabilities.cpu().numpy(), cams))
+        return run_batch
@@ -0,0 +1,199 @@
+"""ONNX Runtime inference backend for the crop disease classifiers.
+
+Export, quantize and check a crop checkpoint from the command line:
+
+    python onnx_backend.py export Potato
+    python onnx_backend.py quantize Potato --mode static --samples sample_leaves/
+    python onnx_backend.py parity Potato --backend onnx-int8 --samples sample_leaves/
+"""
+import argparse
+import json
+import os
+import threading
+
+from lazy_imports import LazyModule
+
+np = LazyModule("numpy")
+torch = LazyModule("torch")
+ort = LazyModule("onnxruntime")
+quantization = LazyModule("onnxruntime.quantization")
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def onnx_path(checkpoint_path, int8=False):
+    root, _ = os.path.splitext(checkpoint_path)
+    return f"{root}.int8.onnx" if int8 else f"{root}.onnx"
+
+
+def is_stale(path, source_path):
+    return not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source_path)
+
+
+def write_atomically(path, write):
+    """Call `write(tmp_path)` and move the result to `path`
+
+    A failed export never leaves a partial graph that is newer than its checkpoint
+    and would therefore pass is_stale().
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def export_onnx(model, path, input_size=224, opset=17):
+    """Export a classifier with a dynamic batch dimension"""
+    model.eval()
+    dummy = torch.zeros(1, 3, input_size, input_size, device=next(model.parameters()).device)
+
+    def write(tmp_path):
+        with torch.no_grad():
+            torch.onnx.export(
+                model, dummy, tmp_path,
+                input_names=["input"],
+                output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=opset,
+            )
+    return write_atomically(path, write)
+
+
+def quantize_int8(src_path, dst_path, mode="dynamic", calibration_batches=None):
+    """INT8-quantize an ONNX graph; static mode calibrates on the given input batches"""
+    if mode == "dynamic":
+        return write_atomically(dst_path, lambda tmp_path: quantization.quantize_dynamic(
+            src_path, tmp_path, weight_type=quantization.QuantType.QInt8))
+
+    if not calibration_batches:
+        raise ValueError("static quantization needs calibration samples")
+
+    class Calibration(quantization.CalibrationDataReader):
+        def __init__(self, batches):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {"input": batch}
+
+    return write_atomically(dst_path, lambda tmp_path: quantization.quantize_static(
+        src_path, tmp_path, Calibration(calibration_batches),
+        quant_format=quantization.QuantFormat.QDQ,
+        activation_type=quantization.QuantType.QUInt8,
+        weight_type=quantization.QuantType.QInt8,
+    ))
+
+
+def ensure_onnx(model, checkpoint_path, input_size=224, int8=False):
+    """Path to an up-to-date (optionally INT8) graph, exporting it from `model` if needed"""
+    fp32_path = onnx_path(checkpoint_path)
+    if is_stale(fp32_path, checkpoint_path):
+        print(f"Exporting {checkpoint_path} to {fp32_path}...")
+        export_onnx(model, fp32_path, input_size)
+    if not int8:
+        return fp32_path
+    int8_path = onnx_path(checkpoint_path, int8=True)
+    if is_stale(int8_path, fp32_path):
+        print(f"Quantizing {fp32_path} to {int8_path} (dynamic)...")
+        quantize_int8(fp32_path, int8_path)
+    return int8_path
+
+
+def create_session(path, intra_op_threads=None):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def make_batch_classifier(session):
+    """Batch function mapping preprocessed image arrays to softmax rows"""
+    input_name = session.get_inputs()[0].name
+
+    def run_batch(tensors):
+        batch = np.stack([np.asarray(t, dtype=np.float32) for t in tensors])
+        logits = session.run(None, {input_name: batch})[0]
+        return list(softmax(logits))
+    return run_batch
+
+
+def parity_check(model, session, batches):
+    """Compare a torch model and an ONNX session on the same inputs"""
+    input_name = session.get_inputs()[0].name
+    device = next(model.parameters()).device
+    total = agree = 0
+    max_diff = 0.0
+    model.eval()
+    for batch in batches:
+        with torch.no_grad():
+            expected = torch.softmax(model(torch.from_numpy(batch).to(device)), dim=1).cpu().numpy()
+        actual = softmax(session.run(None, {input_name: batch})[0])
+        total += len(batch)
+        agree += int((expected.argmax(axis=1) == actual.argmax(axis=1)).sum())
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+    return {
+        "samples": total,
+        "top1_agreement": agree / total if total else None,
+        "max_probability_diff": max_diff,
+    }
+
+
+def sample_batches(sample_dir, preprocess, input_size=224, batch_size=8, random_samples=32):
+    """Preprocessed batches from an image directory, or random inputs when none is given"""
+    if not sample_dir:
+        rng = np.random.default_rng(0)
+        return [rng.standard_normal((batch_size, 3, input_size, input_size), dtype=np.float32)
+                for _ in range(max(1, random_samples // batch_size))]
+
+    paths = sorted(
+        os.path.join(sample_dir, name) for name in os.listdir(sample_dir)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    arrays = [np.asarray(preprocess(path), dtype=np.float32) for path in paths]
+    return [np.stack(arrays[i:i + batch_size]) for i in range(0, len(arrays), batch_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, quantize and check ONNX crop models")
+    parser.add_argument("command", choices=["export", "quantize", "parity"])
+    parser.add_argument("crop", help="Registered crop name, e.g. Potato")
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic",
+                        help="INT8 quantization mode")
+    parser.add_argument("--backend", choices=["onnx", "onnx-int8"], default="onnx",
+                        help="Graph checked by the parity command")
+    parser.add_argument("--samples", help="Directory of leaf images for calibration/parity")
+    args = parser.parse_args()
+
+    from app import model_registry, load_image_tensor
+    from model_registry import build_torch_model
+
+    spec = model_registry.spec(args.crop)
+    if spec is None:
+        parser.error(f"unknown crop {args.crop!r}, choose from {model_registry.crops()}")
+    model = build_torch_model(spec, spec.checkpoint_path, torch.device("cpu"))
+    batches = sample_batches(args.samples, load_image_tensor, spec.input_size)
+
+    if args.command == "export":
+        print(export_onnx(model, onnx_path(spec.checkpoint_path), spec.input_size))
+    elif args.command == "quantize":
+        fp32_path = ensure_onnx(model, spec.checkpoint_path, spec.input_size)
+        print(quantize_int8(fp32_path, onnx_path(spec.checkpoint_path, int8=True), args.mode, batches))
+    else:
+        path = ensure_onnx(model, spec.checkpoint_path, spec.input_size, int8=args.backend == "onnx-int8")
+        report = parity_check(model, create_session(path), batches)
+        print(json.dumps({"crop": spec.name, "backend": args.backend, **report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+features = LazyModule("PIL.features")
+
+OVERLAY_FORMATS = {
+    # format -> (Pillow encoder, file extension, mimetype)
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "png": ("PNG", "png", "image/png"),
+}
+MIMETYPES = {ext: mimetype for _, ext, mimetype in OVERLAY_FORMATS.values()}
+NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.(webp|jpg|png)$")
+
+
+def make_overlay(rgb, cam, predicted_class, colormap):
+    """Blend the Grad-CAM heatmap (or a green tint for healthy leaves) over the model-sized image"""
+    if 'healthy' in predicted_class.lower():
+        return cv2.addWeighted(rgb, 0.7, np.full_like(rgb, (0, 255, 0)), 0.3, 0)
+    cam_uint8 = np.uint8(255 * cam)
+    cam_resized = cv2.resize(cam_uint8, (rgb.shape[1], rgb.shape[0]))
+    heatmap = cv2.applyColorMap(cam_resized, getattr(cv2, f"COLORMAP_{colormap or 'JET'}"))
+    heatmap = cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB)
+    return cv2.addWeighted(rgb, 0.6, heatmap, 0.4, 0)
+
+
+def encode_overlay(overlay, fmt="webp", quality=80):
+    """Encode an RGB overlay array; returns (bytes, file extension)"""
+    if fmt == "webp" and not features.check("webp"):
+        fmt = "jpeg"
+    encoder, ext, _ = OVERLAY_FORMATS[fmt]
+    buffered = io.BytesIO()
+    options = {} if fmt == "png" else {"quality": quality}
+    Image.fromarray(overlay).save(buffered, format=encoder, **options)
+    return buffered.getvalue(), ext
+
+
+class OverlayStore:
+    """Content-addressed on-disk store for encoded overlays, evicting least recently used files past a byte budget"""
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()  # name -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def put(self, data, ext):
+        """Store encoded bytes and return their content-addressed file name"""
+        name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        with self._lock:
+            if name in self._index:
+                self._index.move_to_end(name)
+                return name
+            path = os.path.join(self.root, name)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._index[name] = len(data)
+            self._total += len(data)
+            self._evict()
+        return name
+
+    def path(self, name):
+        """Filesystem path for a stored overlay, or None if unknown/evicted"""
+        if not NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.root, name)
+        with self._lock:
+            if name not in self._index:
+                # Possibly written by another worker process sharing the directory
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    return None
+                self._index[name] = size
+                self._total += size
+            self._index.move_to_end(name)
+        return path
+
+    def stats(self):
+        return {"files": len(self._index), "bytes": self._total, "max_bytes": self.max_bytes}
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif NAME_PATTERN.match(name):
+                stat = os.stat(path)
+                entries.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._total += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
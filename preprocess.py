@@ -0,0 +1,55 @@
+import io
+
+from lazy_imports import LazyModule
+
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_IMAGE_PIXELS = 50_000_000  # ~50 MP, larger than any phone camera
+
+# ImageNet statistics scaled to 0-255 so uint8 pixels can be normalized directly
+_MEAN = None
+_STD = None
+
+
+class ImageRejected(ValueError):
+    """Upload that is not a decodable image within the size limits"""
+
+
+def decode_leaf_image(file, size=224, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode an upload straight to a `size` x `size` RGB uint8 array
+
+    Dimensions are checked from the header before any pixel data is decoded, and
+    JPEGs are decoded at a reduced DCT scale close to `size` instead of full resolution.
+    """
+    data = file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ImageRejected(f"Image is larger than {max_bytes // (1024 * 1024)} MB.")
+    try:
+        image = Image.open(io.BytesIO(data))  # Only parses the header
+    except Exception:
+        raise ImageRejected("File is not a supported image.")
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageRejected("Image resolution is too large.")
+
+    image.draft("RGB", (size, size))  # No-op for non-JPEG formats
+    try:
+        image = image.convert("RGB").resize((size, size), Image.BILINEAR)
+    except Exception:
+        raise ImageRejected("Image data is corrupt.")
+    return np.asarray(image)
+
+
+def to_model_input(rgb):
+    """Normalize an HxWx3 uint8 array into a new CxHxW float32 array in a single pass"""
+    global _MEAN, _STD
+    if _MEAN is None:
+        _MEAN = (np.array([0.485, 0.456, 0.406], dtype=np.float32) * 255).reshape(3, 1, 1)
+        _STD = (np.array([0.229, 0.224, 0.225], dtype=np.float32) * 255).reshape(3, 1, 1)
+    out = np.empty((3,) + rgb.shape[:2], dtype=np.float32)
+    np.subtract(rgb.transpose(2, 0, 1), _MEAN, out=out)
+    out /= _STD
+    return out
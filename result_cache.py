@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ResultCache:
+    """Two-tier (memory LRU + JSON files on disk) cache of detection results with a TTL
+
+    Keys are fingerprints of the decoded, resized model input together with the crop
+    and model version, so a new checkpoint never serves results from the old one.
+    """
+
+    def __init__(self, root, ttl=24 * 3600, max_memory_entries=2048, max_disk_entries=50000,
+                 prune_every=256):
+        self.root = root
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = prune_every
+        self._memory = OrderedDict()  # key -> (expires, value), least recently used first
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(rgb, crop, model_version):
+        digest = hashlib.sha256(f"{crop}|{model_version}|{rgb.shape}|".encode())
+        digest.update(rgb.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return dict(entry[1])
+                del self._memory[key]
+
+        entry = self._read(key)
+        with self._lock:
+            if entry is None or entry[0] <= now:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, entry)
+        return dict(entry[1])
+
+    def put(self, key, value):
+        entry = (time.time() + self.ttl, dict(value))
+        with self._lock:
+            self._remember(key, entry)
+            self._puts += 1
+            prune = self._puts % self.prune_every == 0
+        self._write(key, entry)
+        if prune:
+            self.prune()
+
+    def update(self, key, **fields):
+        """Add fields (e.g. a rendered overlay) to an existing entry, keeping its expiry"""
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None:
+            entry = self._read(key)
+        if entry is None:
+            return
+        entry = (entry[0], {**entry[1], **fields})
+        with self._lock:
+            self._remember(key, entry)
+        self._write(key, entry)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            memory_entries = len(self._memory)
+        lookups = sum(counters.values())
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {**counters, "memory_entries": memory_entries,
+                "hit_ratio": hits / lookups if lookups else None}
+
+    def prune(self):
+        """Drop expired files and the oldest ones beyond the disk budget"""
+        now = time.time()
+        files = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if mtime + self.ttl <= now:
+                self._remove(path)
+            else:
+                files.append((mtime, path))
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_disk_entries)]:
+            self._remove(path)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def _read(self, key):
+        if not KEY_PATTERN.match(key):
+            return None
+        try:
+            with open(self._path(key)) as f:
+                data = json.load(f)
+            return data["expires"], data["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, key, entry):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"expires": entry[0], "value": entry[1]}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing result cache entry: {e}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,113 @@
+"""Pre-fork production server for AgroAI Assist, on gunicorn.
+
+The master process imports the app and loads every crop model once (gunicorn's
+preload_app), then forks gthread workers that share the weights copy-on-write.
+Each worker gets a torch intra-op thread budget so that workers x threads matches
+the core count.
+
+    python serve.py --workers 4 --port 8000
+
+Signals to the master: HUP reloads the checkpoints and replaces the workers
+gracefully, TERM stops the server gracefully, INT/QUIT stop it immediately.
+"""
+import argparse
+import gc
+import os
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+# Checkpoints are reloaded by the master on SIGHUP, so every worker keeps sharing one copy
+os.environ.setdefault("AGROAI_RELOAD_CHECK_SECONDS", "0")
+
+
+def parse_args():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Serve AgroAI Assist with pre-forked workers")
+    parser.add_argument("--host", default=os.environ.get("AGROAI_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("AGROAI_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("AGROAI_WORKERS", max(1, cpus // 2))))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("AGROAI_THREADS", 32)),
+                        help="Request threads per worker; streamed answers and long polls each hold one")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Seconds a stopping worker may spend finishing in-flight requests")
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+    args.torch_threads = args.torch_threads or max(1, cpus // args.workers)
+    return args
+
+
+class Server(BaseApplication):
+    def __init__(self, args):
+        self.args = args
+        self.app = None
+        super().__init__()
+
+    def load_config(self):
+        settings = {
+            "bind": f"{self.args.host}:{self.args.port}",
+            "workers": self.args.workers,
+            "worker_class": "gthread",
+            "threads": self.args.threads,
+            "backlog": 2048,
+            "preload_app": True,
+            "graceful_timeout": self.args.graceful_timeout,
+            "on_reload": self.on_reload,
+            "pre_fork": self.pre_fork,
+            "post_fork": self.post_fork,
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Called once, in the master, before any worker is forked
+        if self.args.workers > 1:
+            # Heatmaps parked by one worker are rendered by whichever worker is asked for them
+            os.environ.setdefault("AGROAI_HEATMAP_DIR", tempfile.mkdtemp(prefix="agroai-heatmaps-"))
+        # Workers dump their metrics here so a scrape of any one of them covers all
+        os.environ.setdefault("AGROAI_METRICS_DIR", tempfile.mkdtemp(prefix="agroai-metrics-"))
+        import torch
+        # OpenMP pools used before fork() can deadlock the children; the master only warms up
+        torch.set_num_threads(1)
+        import app
+        self.app = app
+        self.load_models()
+        print(f"AgroAI Assist loaded, serving with {self.args.workers} workers x "
+              f"{self.args.threads} threads x {self.args.torch_threads} torch threads")
+        return app.app
+
+    def load_models(self, reload=False):
+        registry = self.app.model_registry
+        for name in registry.crops():
+            if reload:
+                registry.reload(name)
+            else:
+                registry.get(name)
+        # SQLite connections must not cross fork(); workers open their own
+        self.app.db_pool.close()
+
+    def on_reload(self, arbiter):
+        # SIGHUP: gunicorn forks a new generation of workers right after this hook
+        print("Reloading models...")
+        self.load_models(reload=True)
+
+    def pre_fork(self, arbiter, worker):
+        # Move everything loaded so far out of the collector's reach, so GC passes in
+        # the workers do not touch (and thereby copy) the shared pages
+        gc.collect()
+        gc.freeze()
+
+    def post_fork(self, arbiter, worker):
+        import torch
+        torch.set_num_threads(self.args.torch_threads)
+        self.app.after_fork()
+
+
+def main():
+    Server(parse_args()).run()
+
+
+if __name__ == "__main__":
+    main()
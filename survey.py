@@ -0,0 +1,105 @@
+import csv
+import io
+import os
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import Future
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+REPORT_FIELDS = ["file", "predicted_class", "confidence", "healthy", "heatmap_url", "error"]
+
+
+class SurveyRejected(ValueError):
+    """Bulk upload that cannot be processed at all (as opposed to a single bad image)"""
+
+
+def iter_uploads(files, archive=None, max_images=500):
+    """Yield (name, file object) for each uploaded image and each image in a zip archive
+
+    Archive members are opened one at a time, so only the image being decoded is
+    held in memory.
+    """
+    count = 0
+    for file in files:
+        if file and file.filename:
+            count += 1
+            if count > max_images:
+                raise SurveyRejected(f"A survey can contain at most {max_images} images.")
+            yield file.filename, file
+
+    if archive is None:
+        return
+    try:
+        bundle = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise SurveyRejected("Archive is not a valid zip file.")
+    with bundle:
+        for info in bundle.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            count += 1
+            if count > max_images:
+                raise SurveyRejected(f"A survey can contain at most {max_images} images.")
+            with bundle.open(info) as member:
+                yield name, member
+
+
+def classify_stream(images, decode, submit, window=16):
+    """Decode images and keep up to `window` classifications in flight
+
+    `submit(rgb)` must return a Future. Yields (name, rgb, probabilities or exception)
+    in upload order, so one bad image or failed inference only fails its own row; a
+    full window lets the batching worker run full batches.
+    """
+    pending = deque()
+    for name, file in images:
+        rgb = None
+        try:
+            rgb = decode(file)
+            future = submit(rgb)
+        except Exception as e:  # ImageRejected, a corrupt archive member, or a model that cannot take it
+            future = Future()
+            future.set_exception(e)
+        pending.append((name, rgb, future))
+        while len(pending) > window:
+            yield _resolve(*pending.popleft())
+    while pending:
+        yield _resolve(*pending.popleft())
+
+
+def _resolve(name, rgb, future):
+    try:
+        return name, rgb, future.result()
+    except Exception as e:
+        return name, rgb, e
+
+
+def summarize(rows):
+    """Field-level summary of per-image report rows"""
+    ok = [row for row in rows if not row.get("error")]
+    healthy = sum(1 for row in ok if row["healthy"])
+    by_class = Counter(row["predicted_class"] for row in ok)
+    confidence = {}
+    for row in ok:
+        confidence.setdefault(row["predicted_class"], []).append(row["confidence"])
+    return {
+        "images": len(rows),
+        "processed": len(ok),
+        "failed": len(rows) - len(ok),
+        "healthy": healthy,
+        "diseased": len(ok) - healthy,
+        "diseased_ratio": (len(ok) - healthy) / len(ok) if ok else None,
+        "by_class": dict(by_class.most_common()),
+        "mean_confidence": {name: sum(values) / len(values) for name, values in confidence.items()},
+    }
+
+
+def to_csv(rows):
+    buffered = io.StringIO()
+    writer = csv.DictWriter(buffered, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffered.getvalue()
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from answer_cache import AnswerCache
+
+
+def test_concurrent_identical_questions_share_one_call():
+    cache = AnswerCache()
+    calls = []
+    release = threading.Event()
+
+    def ask():
+        calls.append(1)
+        release.wait(5)
+        return "Water in the evening."
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", ask))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["Water in the evening."] * 4
+
+
+def test_concurrent_identical_streams_share_one_call():
+    cache = AnswerCache()
+    calls = []
+    release = threading.Event()
+
+    def produce():
+        calls.append(1)
+        yield "Water "
+        release.wait(5)
+        yield "in the evening. "
+
+    leader = cache.stream("k", produce)
+    assert next(leader) == "Water "  # The first stream is now in flight
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append("".join(cache.stream("k", produce))))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    assert "Water " + "".join(leader) == "Water in the evening. "
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["Water in the evening."] * 3
+    assert list(cache.stream("k", produce)) == ["Water in the evening."]
+    assert len(calls) == 1
+
+
+def test_failed_stream_reaches_waiters_and_is_not_cached():
+    cache = AnswerCache()
+
+    def produce():
+        yield "partial"
+        raise ConnectionError("upstream closed")
+
+    leader = cache.stream("k", produce)
+    next(leader)
+    _, future, owner = cache.claim("k")
+    assert not owner
+    with pytest.raises(ConnectionError):
+        list(leader)
+    with pytest.raises(ConnectionError):
+        future.result(1)
+    assert cache.get("k") is None
+
+
+def test_abandoned_stream_releases_waiters():
+    cache = AnswerCache()
+    leader = cache.stream("k", lambda: iter(["partial", "rest"]))
+    next(leader)
+    _, future, _ = cache.claim("k")
+    leader.close()
+    with pytest.raises(RuntimeError):
+        future.result(1)
+    assert list(cache.stream("k", lambda: iter(["again"]))) == ["again"]
+
+
+def test_empty_answers_are_not_cached():
+    cache = AnswerCache()
+    assert list(cache.stream("k", lambda: iter([]))) == []
+    assert cache.get("k") is None
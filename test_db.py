@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    pool = db.ConnectionPool(os.path.join(tmp_path, "test.db"))
+    conn = pool.checkout()
+    db.migrate(conn)
+    yield conn
+    pool.checkin(conn)
+    pool.close()
+
+
+def test_migrations_reach_latest_version(conn):
+    assert db.schema_version(conn) == db.MIGRATIONS[-1][0]
+    assert db.migrate(conn) == db.MIGRATIONS[-1][0]  # Re-running is a no-op
+
+
+def test_hot_queries_use_their_index(conn):
+    assert db.check_query_plans(conn) == []
+
+
+def test_hot_queries_use_their_index_with_data(conn):
+    user_id = db.create_user(conn, "farmer", "farmer@example.com", "x")
+    db.insert_predictions(conn, [(user_id, "Potato", "Early Blight", 90.0, "2024-01-01 00:00:00")] * 200)
+    conn.execute("ANALYZE")
+    assert db.check_query_plans(conn) == []
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import irrigation
+
+
+def test_bulk_plans_match_single_plans():
+    pytest.importorskip("numpy")
+    assert irrigation.parity_check(irrigation.random_fields(20000, seed=1)) == []
+
+
+def test_bulk_plans_match_single_plans_at_thresholds():
+    pytest.importorskip("numpy")
+    fields = [
+        {"crop_type": crop, "field_size": size, "soil_type": "loamy", "growth_stage": "flowering",
+         "temperature": temperature, "humidity": humidity}
+        for crop in ("rice", "unknown")
+        for size in (0.0, 0.5, 1.25, 2.5)
+        for temperature in (25, 25.0001, 30, 30.0001)
+        for humidity in (49.999, 50)
+    ]
+    assert irrigation.parity_check(fields) == []
+
+
+def test_read_fields_accepts_csv_and_json():
+    csv_text = "crop-type,field-size,soil-type,growth-stage,temperature,humidity\ntomato,2,clay,seedling,28,40\n"
+    json_text = json.dumps([{"crop_type": "tomato", "field_size": 2, "soil_type": "clay",
+                             "growth_stage": "seedling", "temperature": 28, "humidity": 40}])
+    assert irrigation.read_fields(csv_text, "csv") == irrigation.read_fields(json_text, "json")
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf"])
+def test_read_fields_rejects_non_finite_numbers(value):
+    text = ("crop_type,field_size,soil_type,growth_stage,temperature,humidity\n"
+            "tomato,2,clay,seedling,28,40\n"
+            f"tomato,{value},clay,seedling,28,40\n")
+    with pytest.raises(irrigation.FieldsRejected, match="Field 2"):
+        irrigation.read_fields(text)
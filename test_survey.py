@@ -0,0 +1,36 @@
+from concurrent.futures import Future
+
+import survey
+
+
+def resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_failures_only_fail_their_own_image():
+    def decode(file):
+        if file == "corrupt":
+            raise ValueError("Not an image.")
+        return file
+
+    def submit(rgb):
+        if rgb == "unlucky":
+            raise RuntimeError("Potato model is not available")
+        if rgb == "broken":
+            failed = Future()
+            failed.set_exception(RuntimeError("batch failed"))
+            return failed
+        return resolved(f"probabilities for {rgb}")
+
+    images = [(name, name) for name in ["a", "corrupt", "unlucky", "broken", "b"]]
+    results = list(survey.classify_stream(images, decode, submit, window=2))
+
+    assert [name for name, _, _ in results] == ["a", "corrupt", "unlucky", "broken", "b"]
+    outcomes = dict((name, outcome) for name, _, outcome in results)
+    assert outcomes["a"] == "probabilities for a"
+    assert outcomes["b"] == "probabilities for b"
+    assert isinstance(outcomes["corrupt"], ValueError)
+    assert isinstance(outcomes["unlucky"], RuntimeError)
+    assert isinstance(outcomes["broken"], RuntimeError)
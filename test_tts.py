@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from tts import AudioStore, SpeechJobs, speech_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AudioStore(str(tmp_path), janitor_interval=0)
+
+
+def test_unknown_job_is_not_pending(store):
+    assert store.status(speech_key("never submitted", "en")) == (None, None)
+    assert store.status("not-a-key") == (None, None)
+    assert store.wait(speech_key("never submitted", "en"), 0.1) == (None, None)
+
+
+def test_job_markers_are_visible_to_other_stores(tmp_path, store):
+    release = threading.Event()
+
+    def synthesize(text, lang, voice):
+        release.wait(5)
+        return b"mp3"
+
+    jobs = SpeechJobs(synthesize, store)
+    key = jobs.submit("Water in the evening.")
+    other = AudioStore(str(tmp_path), janitor_interval=0)  # Another worker process sharing the directory
+    assert other.status(key) == ("pending", None)
+    release.set()
+    assert jobs.request(key).result(5) == f"{key}.mp3"
+    assert other.status(key) == ("ready", f"{key}.mp3")
+    assert not (tmp_path / f"{key}.job").exists()
+
+
+def test_failed_job_is_reported_as_failed(tmp_path, store):
+    def synthesize(text, lang, voice):
+        raise ConnectionError("gTTS unavailable")
+
+    jobs = SpeechJobs(synthesize, store)
+    key = jobs.submit("Water in the evening.")
+    with pytest.raises(ConnectionError):
+        jobs.request(key).result(5)
+    other = AudioStore(str(tmp_path), janitor_interval=0)
+    assert other.wait(key, 5) == ("failed", None)
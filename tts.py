@@ -0,0 +1,284 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.mp3$")
+MARKERS = (".job", ".failed")  # Synthesis started / failed, for processes that did not run it
+
+
+def split_text(text, max_chars=500):
+    """Split text into chunks of at most `max_chars`, breaking at sentence ends where possible"""
+    pieces = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] += " " + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def speech_key(text, lang, voice=""):
+    """Content address for synthesised speech: the cleaned text plus the settings that change the audio"""
+    return hashlib.sha256("\x1f".join([text, lang, voice]).encode()).hexdigest()
+
+
+class AudioStore:
+    """On-disk MP3 cache keyed by `speech_key`, evicting least recently used files past a byte budget
+
+    Alongside the audio, `{key}.job` and `{key}.failed` marker files record syntheses
+    that are running or have failed, so every worker process sharing the directory can
+    tell an unfinished job from an unknown one. A janitor thread periodically picks up
+    files written by other worker processes, re-applies the budget and deletes files
+    that are not part of the cache (partial writes, stale markers, audio from older
+    naming schemes).
+    """
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024, janitor_interval=300):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.janitor_interval = janitor_interval
+        self._index = OrderedDict()  # name -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+        self.start_janitor()
+
+    def start_janitor(self):
+        """Start the janitor thread (again in a forked worker, where the parent's does not exist)"""
+        if self.janitor_interval:
+            threading.Thread(target=self._janitor, name="tts-janitor", daemon=True).start()
+
+    def get(self, key):
+        """File name for cached audio, or None"""
+        if not KEY_PATTERN.match(key):
+            return None
+        name = f"{key}.mp3"
+        path = os.path.join(self.root, name)
+        with self._lock:
+            if name not in self._index:
+                # Possibly written by another worker process sharing the directory
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    return None
+                self._index[name] = size
+                self._total += size
+            self._index.move_to_end(name)
+        try:
+            # Keep recency across restarts, which rebuild the LRU order from mtimes
+            os.utime(path)
+        except OSError:
+            pass
+        return name
+
+    def status(self, key):
+        """("ready", file name), ("pending", None), ("failed", None), or (None, None) if no job has `key`"""
+        if not KEY_PATTERN.match(key):
+            return None, None
+        name = self.get(key)
+        if name is not None:
+            return "ready", name
+        if os.path.exists(os.path.join(self.root, f"{key}.failed")):
+            return "failed", None
+        if os.path.exists(os.path.join(self.root, f"{key}.job")):
+            return "pending", None
+        return None, None
+
+    def wait(self, key, timeout):
+        """`status(key)` once the job is no longer pending, or when `timeout` seconds have passed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            state, name = self.status(key)
+            if state != "pending" or time.monotonic() >= deadline:
+                return state, name
+            time.sleep(0.25)
+
+    def mark_started(self, key):
+        self._mark(key, ".job", ".failed")
+
+    def mark_failed(self, key):
+        self._mark(key, ".failed", ".job")
+
+    def _mark(self, key, marker, clears):
+        try:
+            with open(os.path.join(self.root, key + marker), "wb"):
+                pass
+        except OSError as e:
+            print(f"Error marking speech job: {e}")
+        self._unmark(key, clears)
+
+    def _unmark(self, key, marker):
+        try:
+            os.remove(os.path.join(self.root, key + marker))
+        except OSError:
+            pass
+
+    def put(self, key, parts):
+        """Write the concatenated audio parts under `key` and return the file name"""
+        name = f"{key}.mp3"
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            for part in parts:
+                f.write(part)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._total += size - self._index.pop(name, 0)
+            self._index[name] = size
+            self._evict()
+        self._unmark(key, ".job")
+        return name
+
+    def stats(self):
+        return {"files": len(self._index), "bytes": self._total, "max_bytes": self.max_bytes}
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if NAME_PATTERN.match(name):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+            elif name.endswith((".mp3", ".tmp")):
+                os.remove(path)
+        with self._lock:
+            for _, name, size in sorted(entries):
+                self._index[name] = size
+                self._total += size
+            self._evict()
+
+    def _janitor(self):
+        while True:
+            time.sleep(self.janitor_interval)
+            try:
+                self._sweep()
+            except OSError as e:
+                print(f"Error cleaning audio cache: {e}")
+
+    def _sweep(self):
+        cutoff = time.time() - self.janitor_interval
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if NAME_PATTERN.match(name):
+                    size = os.path.getsize(path)
+                    with self._lock:
+                        if name not in self._index:
+                            self._index[name] = size
+                            self._index.move_to_end(name, last=False)
+                            self._total += size
+                # Leave files young enough to be a write or a synthesis in progress
+                elif name.endswith((".mp3", ".tmp") + MARKERS) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            for name in [name for name in self._index if not os.path.exists(os.path.join(self.root, name))]:
+                self._total -= self._index.pop(name)
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+
+
+class SpeechJobs:
+    """Background text-to-speech
+
+    `submit` returns a job ID immediately: the speech key, so any process sharing the
+    store can find the finished file. Audio already in the store is reused, and an
+    identical text submitted while one is being synthesised shares that job's work.
+    Otherwise the text is split into sentence-aligned chunks, which are synthesised in
+    parallel and joined into one MP3 (MP3 streams can be concatenated frame-wise).
+    Job state is kept until the entry expires.
+    """
+
+    def __init__(self, synthesize, store, max_workers=2, chunk_workers=4, chunk_chars=500,
+                 ttl=600, max_entries=1000):
+        self._synthesize = synthesize
+        self.store = store
+        self.chunk_chars = chunk_chars
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Separate pools, so jobs waiting on their chunks can never starve the chunk workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="tts")
+        self._chunk_executor = ThreadPoolExecutor(chunk_workers, thread_name_prefix="tts-chunk")
+        self._jobs = OrderedDict()  # speech key -> {"future", "expires"}, oldest first
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def submit(self, text, lang="en", voice=""):
+        """Queue synthesis of `text` and return its job ID"""
+        key = speech_key(text, lang, voice)
+        name = self.store.get(key)
+        with self._lock:
+            self._prune(time.monotonic())
+            entry = self._jobs.pop(key, None)
+            if name is not None:
+                self.counters["hits"] += 1
+                future = Future()
+                future.set_result(name)
+            elif entry is not None and not entry["future"].done():
+                self.counters["coalesced"] += 1
+                future = entry["future"]
+            else:
+                self.counters["misses"] += 1
+                self.store.mark_started(key)
+                future = self._executor.submit(self._run, key, text, lang, voice)
+            self._jobs[key] = {"future": future, "expires": time.monotonic() + self.ttl}
+        return key
+
+    def request(self, job_id):
+        """Future for the audio file name of a job started in this process; None if unknown/expired"""
+        with self._lock:
+            self._prune(time.monotonic())
+            entry = self._jobs.get(job_id)
+            return entry["future"] if entry is not None else None
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = sum(counters.values())
+        hit_ratio = (counters["hits"] + counters["coalesced"]) / lookups if lookups else None
+        return {**counters, **self.store.stats(), "hit_ratio": hit_ratio}
+
+    def _run(self, key, text, lang, voice):
+        try:
+            chunks = split_text(text, self.chunk_chars)
+            if not chunks:
+                raise ValueError("Nothing to synthesise")
+            parts = list(self._chunk_executor.map(lambda chunk: self._synthesize(chunk, lang, voice), chunks))
+            return self.store.put(key, parts)
+        except Exception:
+            self.store.mark_failed(key)
+            raise
+
+    def _prune(self, now):
+        # Entries are kept in insertion order, which is also expiry order
+        while self._jobs and next(iter(self._jobs.values()))["expires"] <= now:
+            self._jobs.popitem(last=False)
+        while len(self._jobs) > self.max_entries:
+            self._jobs.popitem(last=False)
@@ -0,0 +1,146 @@
+"""Weather lookups through the server, cached per location tile.
+
+Coordinates are snapped to a grid (0.1 degrees, about 11 km, by default) and the
+provider is asked about the tile centre, so neighbouring farms share one cached
+response. Concurrent misses for the same tile share one upstream call.
+"""
+import threading
+import time
+
+from coalescing_cache import CoalescingCache
+from lazy_imports import LazyModule
+
+httpx = LazyModule("httpx")
+
+KINDS = ("weather", "forecast")  # Current conditions, 5-day / 3-hour forecast
+DEFAULT_TTLS = {"weather": 10 * 60, "forecast": 60 * 60}
+
+
+class WeatherRejected(ValueError):
+    """A lookup that cannot be served, e.g. coordinates out of range"""
+
+
+class OpenWeatherMapProvider:
+    """OpenWeatherMap's 2.5 API over one pooled keep-alive HTTP client"""
+
+    base_url = "https://api.openweathermap.org/data/2.5"
+
+    def __init__(self, api_key, timeout=5.0, max_connections=20):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                )
+            return self._client
+
+    def fetch(self, kind, **query):
+        """Raw JSON response for `kind` ("weather" or "forecast") at lat/lon or city `q`"""
+        response = self.client().get(f"/{kind}", params={**query, "appid": self.api_key})
+        response.raise_for_status()
+        return response.json()
+
+    def after_fork(self):
+        # Pooled sockets must not be shared with the parent process
+        with self._lock:
+            self._client = None
+
+
+class StubProvider:
+    """Deterministic responses in OpenWeatherMap's shape (temperatures in kelvin), for offline use"""
+
+    def fetch(self, kind, lat=None, lon=None, q=None):
+        if q is not None:
+            lat, lon = 10.0, 76.3
+        now = int(time.time())
+        if kind == "weather":
+            return {"cod": 200, "name": q or "Stub", "coord": {"lat": lat, "lon": lon}, "dt": now,
+                    **self._sample(lat, 0)}
+        return {
+            "city": {"name": "Stub", "coord": {"lat": lat, "lon": lon}},
+            "list": [{"dt": now + hour * 3600,
+                      "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now + hour * 3600)),
+                      **self._sample(lat, hour)} for hour in range(0, 120, 3)],
+        }
+
+    @staticmethod
+    def _sample(lat, hour):
+        temp = 273.15 + 30 - abs(lat) / 3 + 4 * ((hour % 24) in (9, 12, 15))
+        return {
+            "main": {"temp": temp, "feels_like": temp, "temp_min": temp - 2, "temp_max": temp + 2,
+                     "humidity": 65, "pressure": 1010},
+            "weather": [{"main": "Clouds", "description": "scattered clouds", "icon": "03d"}],
+            "wind": {"speed": 3.0, "deg": 200},
+            "clouds": {"all": 40},
+            "visibility": 10000,
+            "sys": {"country": "IN", "sunrise": 0, "sunset": 0},
+        }
+
+    def after_fork(self):
+        pass
+
+
+class WeatherCache:
+    """TTL+LRU cache of provider responses per (kind, tile), with request coalescing"""
+
+    def __init__(self, fetch, ttls=None, tile_degrees=0.1, max_entries=4096):
+        self.fetch = fetch  # fetch(kind, lat=..., lon=...) or fetch("weather", q=...), e.g. a provider's fetch
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.tile_degrees = tile_degrees
+        self._responses = CoalescingCache(max_entries)
+
+    def tile(self, lat, lon):
+        """Centre of the grid tile containing lat/lon"""
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise WeatherRejected("Latitude and longitude must be numbers.")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise WeatherRejected("Latitude must be within ±90 and longitude within ±180.")
+        snap = lambda value: round(round(value / self.tile_degrees) * self.tile_degrees, 6)
+        return snap(lat), snap(lon)
+
+    def get(self, kind, lat, lon):
+        """(response, tile) for the tile containing lat/lon, calling the provider on a miss"""
+        if kind not in KINDS:
+            raise WeatherRejected(f"Unknown weather kind: {kind}.")
+        lat, lon = self.tile(lat, lon)
+        response = self._responses.get_or_compute(
+            (kind, lat, lon), lambda: self.fetch(kind, lat=lat, lon=lon), self.ttls[kind])
+        return response, (lat, lon)
+
+    def get_city(self, city):
+        """Current weather for a city name; also cached for the city's own tile"""
+        name = " ".join(city.split()).casefold()
+        if not name:
+            raise WeatherRejected("Enter a city name.")
+        response = self._responses.get_or_compute(
+            ("city", name), lambda: self.fetch("weather", q=name), self.ttls["weather"])
+        coord = response.get("coord") or {}
+        if "lat" in coord and "lon" in coord:
+            try:
+                self._responses.put(("weather",) + self.tile(coord["lat"], coord["lon"]),
+                                    response, self.ttls["weather"])
+            except WeatherRejected:
+                pass
+        return response
+
+    def stats(self):
+        return self._responses.stats()
+
+
+def current_conditions(response):
+    """Temperature (°C, one decimal) and humidity (%) from a current-weather response"""
+    main = response.get("main") or {}
+    if "temp" not in main or "humidity" not in main:
+        return None
+    return {"temperature": round(main["temp"] - 273.15, 1), "humidity": main["humidity"]}
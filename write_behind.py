@@ -0,0 +1,133 @@
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import db
+
+
+class PredictionWriter:
+    """Write-behind logger that batches prediction inserts on a background thread
+
+    Rows are queued and committed in batches of up to `batch_size`, at least every
+    `flush_interval` seconds, and on shutdown. Until a row is committed it is kept
+    per user so that user's own history reads still include it (read-your-writes).
+    """
+
+    def __init__(self, pool, max_queue=10000, batch_size=200, flush_interval=0.5):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._pending = defaultdict(list)  # user_id -> uncommitted rows, oldest first
+        self._pending_lock = threading.Lock()
+        # Held while a batch commits and while history is read, so a row is never seen twice or missed
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="prediction-writer", daemon=True)
+        self._thread.start()
+
+    def after_fork(self):
+        """Start a fresh writer in a forked worker; the parent's thread does not exist there"""
+        self._start()
+
+    def submit(self, user_id, crop_type, predicted_class, confidence):
+        created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # Same format as CURRENT_TIMESTAMP
+        row = (user_id, crop_type, predicted_class, confidence, created_at)
+        with self._pending_lock:
+            self._pending[user_id].append(row)
+        try:
+            self._queue.put(row, timeout=5)
+        except queue.Full:
+            # Writer is badly behind: fall back to a synchronous write rather than drop the row
+            self._commit([row])
+
+    def recent_predictions(self, conn, user_id, limit=5):
+        with self._flush_lock:
+            rows = db.recent_predictions(conn, user_id, limit)
+            pending = self._pending_rows(user_id)
+        rows += [db.Prediction(created_at, crop_type, predicted_class, confidence)
+                 for _, crop_type, predicted_class, confidence, created_at in pending]
+        rows.sort(key=lambda row: row.created_at, reverse=True)
+        return rows[:limit]
+
+    def prediction_summary(self, conn, user_id):
+        with self._flush_lock:
+            summary = db.prediction_summary(conn, user_id)
+            pending = self._pending_rows(user_id)
+        if not pending:
+            return summary
+        healthy = sum(1 for row in pending if db.is_healthy(row[2]))
+        diseased = len(pending) - healthy
+        return summary._replace(
+            healthy=summary.healthy + healthy,
+            diseased=summary.diseased + diseased,
+            recent_healthy=summary.recent_healthy + healthy,
+            recent_diseased=summary.recent_diseased + diseased,
+            last_seen=max(summary.last_seen or "", pending[-1][4]),
+        )
+
+    def pending_count(self):
+        return self._queue.qsize()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _pending_rows(self, user_id):
+        with self._pending_lock:
+            return list(self._pending.get(user_id, ()))
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        conn = self.pool.checkout()
+        try:
+            with self._flush_lock:
+                db.insert_predictions(conn, batch)
+                with self._pending_lock:
+                    for row in batch:
+                        rows = self._pending[row[0]]
+                        rows.remove(row)
+                        if not rows:
+                            del self._pending[row[0]]
+        except Exception as e:
+            # Rows stay pending (and visible to their users) until a later batch succeeds
+            print(f"Error writing prediction batch of {len(batch)}: {e}")
+            self._requeue(batch)
+        finally:
+            self.pool.checkin(conn)
+
+    def _requeue(self, batch):
+        for row in batch:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                print(f"Dropping prediction for user {row[0]}: write-behind queue is full")
+                with self._pending_lock:
+                    self._pending[row[0]].remove(row)